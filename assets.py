@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+import pygame
+
+from sim import BUFF_RADIUS, level_configs
+
+# Sprites live in atlas images, already scaled to the size they are drawn at, with a
+# JSON index of where each one sits. The game reads an atlas once and hands out
+# subsurfaces, so there are few files to fetch (one request each on the web build),
+# no per-sprite scaling at startup and every blit comes from the same texture.
+#
+# Sprites are split into groups with one atlas each: "menu" holds what the level
+# select screen needs, "game" everything else. AssetLoader loads a group the first
+# time one of its sprites is asked for and can prefetch the rest a bit per frame.
+#
+# Rebuild after changing any source image:  python assets.py  (--force rebuilds all)
+# Each atlas records a hash of its source images, and the build skips groups whose
+# sources have not changed. The game itself never reads the sources to check: it
+# trusts atlas.json and only loads the loose images when an atlas is unusable.
+
+INDEX_PATH = "atlas.json"
+ATLAS_VERSION = 2
+ATLAS_MAX_WIDTH = 1024
+PADDING = 1  # keeps neighbours from bleeding into each other when scaled on the GPU
+
+PURPLE = (180, 0, 255)
+LEVEL_THUMB_SIZE = (300, 300)
+PORTAL_SIZE = (60, 60)
+BUFF_SIZE = (BUFF_RADIUS * 2, BUFF_RADIUS * 2)
+
+# (name, source file, size in the atlas, group)
+# level thumbnails come from the level files, one "level<i>" sprite per level
+SPRITES = [
+    (f"level{i}", config.get("thumbnail", ""), LEVEL_THUMB_SIZE, "menu") for i, config in enumerate(level_configs)
+] + [
+    (f"portal{i}", f"portal{i}.png", PORTAL_SIZE, "game") for i in range(8)
+] + [
+    ("buff_jump", "jumpbuff.png", BUFF_SIZE, "game"),
+    ("buff_freeze", "freezebuff.png", BUFF_SIZE, "game"),
+    ("buff_size", "growbuff.png", BUFF_SIZE, "game"),
+    ("buff_shield", "shieldbuff.png", BUFF_SIZE, "game"),
+    ("buff_speed", "speedbuff.png", BUFF_SIZE, "game"),
+]
+GROUPS = list(dict.fromkeys(group for *_, group in SPRITES))
+
+
+def atlas_path(group):
+    return f"atlas_{group}.png"
+
+
+# --- PLACEHOLDERS ---
+def _fallback(name, size):
+    # stand-ins for missing files so the game still starts
+    w, h = size
+    img = pygame.Surface(size, pygame.SRCALPHA)
+    r = min(w, h) // 2
+    if name.startswith("portal"):
+        pygame.draw.circle(img, PURPLE, (r, r), r)
+    elif name.startswith("buff"):
+        pygame.draw.circle(img, (100, 200, 255), (r, r), r)
+        pygame.draw.circle(img, (0, 0, 0), (r, r), r, 3)
+        pygame.draw.line(img, (255, 255, 255), (5, r), (w - 5, r), 3)
+    else:
+        img.fill((200, 200, 200))
+    return img
+
+
+def load_sprite(name, path, size):
+    try:
+        img = pygame.image.load(path)
+    except Exception as e:
+        print(f"[!] Could not load image {path}: {e}")
+        return _fallback(name, size)
+    # plain scale keeps the pixel art crisp
+    return pygame.transform.scale(img, size)
+
+
+# --- BUILD ---
+def group_sprites(group):
+    return [(name, path, size) for name, path, size, g in SPRITES if g == group]
+
+
+def sources_hash(sprites):
+    h = hashlib.sha1(str(ATLAS_VERSION).encode())
+    for name, path, size in sprites:
+        h.update(f"{name}:{path}:{size}".encode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def pack(sizes, max_width=ATLAS_MAX_WIDTH):
+    # shelf packing, tallest first: returns ({index: (x, y)}, (width, height))
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    placed = {}
+    x = y = shelf_h = width = 0
+    for i in order:
+        w, h = sizes[i]
+        if x and x + w > max_width:
+            x, y, shelf_h = 0, y + shelf_h + PADDING, 0
+        placed[i] = (x, y)
+        x += w + PADDING
+        shelf_h = max(shelf_h, h)
+        width = max(width, x - PADDING)
+    return placed, (width, y + shelf_h)
+
+
+def build_atlas(group):
+    sprites = group_sprites(group)
+    images = [load_sprite(name, path, size) for name, path, size in sprites]
+    placed, atlas_size = pack([img.get_size() for img in images])
+    sheet = pygame.Surface(atlas_size, pygame.SRCALPHA)
+    index = {}
+    for i, ((name, _, _), img) in enumerate(zip(sprites, images)):
+        x, y = placed[i]
+        sheet.blit(img, (x, y))
+        index[name] = [x, y, *img.get_size()]
+    meta = {"file": atlas_path(group), "sources": sources_hash(sprites), "size": list(atlas_size), "sprites": index}
+    return sheet, meta
+
+
+def read_index(index_path=INDEX_PATH):
+    # the groups of a current-version atlas.json, {} if there is none
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[!] Could not read {index_path}: {e}")
+        return {}
+    return index["groups"] if index.get("version") == ATLAS_VERSION else {}
+
+
+def build_all(index_path=INDEX_PATH, force=False):
+    # (re)build the atlas of every group whose sources changed; returns (index, groups rebuilt)
+    old = {} if force else read_index(index_path)
+    index = {"version": ATLAS_VERSION, "groups": {}}
+    rebuilt = []
+    for group in GROUPS:
+        meta = old.get(group)
+        if meta is None or meta.get("sources") != sources_hash(group_sprites(group)) or not os.path.exists(meta["file"]):
+            sheet, meta = build_atlas(group)
+            pygame.image.save(sheet, meta["file"])
+            rebuilt.append(group)
+        index["groups"][group] = meta
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=1)
+    return index, rebuilt
+
+
+# --- LOAD ---
+def load_atlas(group, meta=None):
+    # {name: subsurface of the group's atlas sheet}: one image read. Whether the atlas
+    # is older than its sources is for `python assets.py` to find out, not startup.
+    # Loads the source images one by one if the atlas is missing or unreadable.
+    sprites = group_sprites(group)
+    try:
+        if meta is None:
+            raise ValueError("not in the index")
+        if set(meta["sprites"]) != {name for name, _, _ in sprites}:
+            raise ValueError("sprites were added or removed since it was built")
+        sheet = pygame.image.load(meta["file"])
+    except Exception as e:
+        print(f"[!] No usable {group} atlas ({e}), loading the source images")
+        images = {name: load_sprite(name, path, size) for name, path, size in sprites}
+        if pygame.display.get_surface() is not None:
+            images = {name: img.convert_alpha() for name, img in images.items()}
+        return images
+    if pygame.display.get_surface() is not None:
+        sheet = sheet.convert_alpha()
+    return {name: sheet.subsurface(pygame.Rect(rect)) for name, rect in meta["sprites"].items()}
+
+
+class AssetLoader:
+    # Sprites and other slow-to-make assets (fonts) are created on first use. Anything
+    # queued with prefetch() is loaded a few milliseconds at a time by step(), which the
+    # menu loop calls every frame so the game assets are ready before they are needed.
+    def __init__(self, index_path=INDEX_PATH):
+        self.groups = read_index(index_path)
+        self.group_of = {name: group for name, _, _, group in SPRITES}
+        self.sprites = {}
+        self.factories = {}
+        self.values = {}
+        self.loaded = set()
+        self.queue = []
+        self.timings = {}  # key -> ms it took to load
+
+    def add(self, key, factory):
+        # register a non-sprite asset, made by calling factory() the first time it is needed
+        self.factories[key] = factory
+
+    def _load(self, key):
+        if key in self.loaded:
+            return
+        start = time.perf_counter()
+        if key in self.factories:
+            self.values[key] = self.factories[key]()
+        else:
+            self.sprites.update(load_atlas(key, self.groups.get(key)))
+        self.loaded.add(key)
+        self.timings[key] = (time.perf_counter() - start) * 1000
+
+    def get(self, name):
+        if name in self.factories:
+            self._load(name)
+            return self.values[name]
+        if name not in self.sprites:
+            self._load(self.group_of[name])
+        return self.sprites[name]
+
+    def prefetch(self, *keys):
+        self.queue.extend(k for k in keys if k not in self.loaded and k not in self.queue)
+
+    def step(self, budget_ms=4.0):
+        # load queued assets until the budget is spent; True while more are waiting
+        start = time.perf_counter()
+        while self.queue and (time.perf_counter() - start) * 1000 < budget_ms:
+            self._load(self.queue.pop(0))
+        return bool(self.queue)
+
+    @property
+    def done(self):
+        return not self.queue
+
+
+def main():
+    index, rebuilt = build_all(force="--force" in sys.argv[1:])
+    for group, meta in index["groups"].items():
+        w, h = meta["size"]
+        state = "wrote" if group in rebuilt else "up to date:"
+        print(f"{state} {meta['file']} {w}x{h} with {len(meta['sprites'])} sprites")
+
+
+if __name__ == "__main__":
+    main()
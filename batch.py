@@ -0,0 +1,498 @@
+import argparse
+import time
+
+import numpy as np
+
+from collision import ConvexShape, platform_spans
+from sim import (WIDTH, HEIGHT, FPS, ROUND_TIME, BUFF_RADIUS, MAX_ACTIVE_BUFFS, PORTAL_RADIUS,
+                 INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, level_configs, buff_defs)
+
+# Many matches of tag advanced together. Every piece of per-match state is one numpy
+# array (struct of arrays) with the match as the first axis and the player as the
+# second, so one step() call moves all of them with a handful of vectorized ops.
+#
+# The rules follow sim.GameState: resolve_collision's gravity / jump cap / max fall /
+# step-up, the buff effects, portals and the shielded tag check. Picking up a buff
+# type the player already holds stacks, like GameState's modifier stack: every
+# pickup has its own timer and multiplies (or grows) on top of the others. The one
+# difference: random draws come from a numpy Generator, so a batch does not
+# reproduce a GameState with the same seed.
+
+PLAYERS = 2
+BUFF_TYPES = list(buff_defs.keys())
+SPEED, JUMP, SIZE, SHIELD, FREEZE = (BUFF_TYPES.index(name) for name in ("speed", "jump", "size", "shield", "freeze"))
+BUFF_SLOTS = MAX_ACTIVE_BUFFS
+BUFF_STACKS = 2  # pickups of one type a player can hold at first; grows when a pickup needs more
+STEP_HEIGHT = 10
+
+
+def _pg_round(v):
+    # pygame.Rect rounds float assignments half away from zero
+    return np.where(v >= 0, np.floor(v + 0.5), np.ceil(v - 0.5)).astype(np.int64)
+
+
+def level_boxes(objects):
+    # (left, top, right, bottom) per platform, using the same one-pixel growth as the
+    # swept collision so results line up with the mask path
+    boxes = []
+    for verts in objects:
+        shape = ConvexShape(verts)
+        if len(shape.points) != 4 or len(shape.axes) != 2:
+            raise ValueError("batch simulation only supports axis-aligned rectangular platforms")
+        b = shape.bounds
+        boxes.append((b.left, b.top, b.right, b.bottom))
+    return np.array(boxes, dtype=np.int64).reshape(-1, 4)
+
+
+def level_spans(config):
+    spans = config.get("spawn_zones") or platform_spans(config["objects"])
+    return np.array(spans, dtype=np.int64).reshape(-1, 4)
+
+
+class BatchSim:
+    def __init__(self, n, level=0, seed=None, round_time=ROUND_TIME, config=None, buffs=None):
+        # buffs: optional {type_name: {key: value}} overrides on top of buff_defs
+        self.n = n
+        self.config = dict(config if config is not None else level_configs[level])
+        defs = {name: {**conf, **(buffs or {}).get(name, {})} for name, conf in buff_defs.items()}
+        self.rng = np.random.default_rng(seed)
+        self.width = self.config.get("width", WIDTH)
+        self.height = self.config.get("height", HEIGHT)
+        self.boxes = level_boxes(self.config["objects"])
+        self.spans = level_spans(self.config)
+        self.gravity = float(self.config["gravity"])
+        self.max_fall = float(self.config["playerMaxFall"])
+        self.base_speed = float(self.config["playerSpeed"])
+        self.base_jump = float(self.config["playerJump"])
+        self.base_size = int(self.config["playerSize"])
+        self.round_frames = round_time * FPS
+
+        self.durations = np.array([defs[t]["duration"] for t in BUFF_TYPES], dtype=np.int32)
+        self.speed_mult = float(defs["speed"]["multiplier"])
+        self.jump_mult = float(defs["jump"]["multiplier"])
+        self.inflate = defs["size"]["inflate"]
+        self.slow_factor = float(defs["freeze"]["slow_factor"])
+
+        P, S, T = PLAYERS, BUFF_SLOTS, len(BUFF_TYPES)
+        # players
+        self.x = np.zeros((n, P), np.int64)
+        self.y = np.zeros((n, P), np.int64)
+        self.w = np.zeros((n, P), np.int64)
+        self.h = np.zeros((n, P), np.int64)
+        self.vel_y = np.zeros((n, P), np.float64)
+        self.on_ground = np.zeros((n, P), bool)
+        self.on_ceiling = np.zeros((n, P), bool)
+        self.speed = np.zeros((n, P), np.float64)
+        self.jump = np.zeros((n, P), np.float64)
+        self.shield = np.zeros((n, P), bool)
+        self.frozen = np.zeros((n, P), bool)
+        self.buff_timer = np.zeros((n, P, T, BUFF_STACKS), np.int32)  # one timer per held pickup
+        # buffs lying on the ground
+        self.buff_alive = np.zeros((n, S), bool)
+        self.buff_x = np.zeros((n, S), np.float64)
+        self.buff_y = np.zeros((n, S), np.float64)
+        self.buff_type = np.zeros((n, S), np.int8)
+        self.buff_bob = np.zeros((n, S), np.float64)
+        self.buffs_spawned = np.zeros(n, np.int64)
+        # portals
+        self.portal_pos = np.zeros((n, 2, 2), np.int64)
+        self.portal_active = np.zeros(n, bool)
+        self.portal_cooldown = np.zeros(n, np.int64)
+        self.teleport_active = np.zeros((n, P), bool)
+        self.teleport_progress = np.zeros((n, P), np.float64)
+        self.teleport_target = np.zeros((n, P, 2), np.int64)
+        # match
+        self.tagger = np.zeros(n, np.int64)
+        self.tagging = np.zeros(n, bool)
+        self.tags = np.zeros(n, np.int64)
+        self.first_tag = np.zeros(n, np.int64)  # frame of the first tag, -1 if none yet
+        self.frame = np.zeros(n, np.int64)
+        self.done = np.zeros(n, bool)
+
+        self.reset()
+
+    # --- SETUP ---
+    def reset(self, which=None):
+        # re-start the selected matches (all of them by default)
+        m = np.ones(self.n, bool) if which is None else np.asarray(which, bool)
+        k = int(m.sum())
+        if k == 0:
+            return
+        size = self.base_size
+        self.x[m] = (self.width // 2 + 20, self.width // 2 - 20)
+        self.y[m] = self.height // 2
+        self.w[m] = size
+        self.h[m] = size
+        self.vel_y[m] = 0
+        self.on_ground[m] = False
+        self.on_ceiling[m] = False
+        self.speed[m] = self.base_speed
+        self.jump[m] = self.base_jump
+        self.shield[m] = False
+        self.frozen[m] = False
+        self.buff_timer[m] = 0
+        self.buff_alive[m] = False
+        self.buffs_spawned[m] = 0
+        self.teleport_active[m] = False
+        self.teleport_progress[m] = 0
+        self.tagger[m] = self.rng.integers(0, PLAYERS, k)
+        self.tagging[m] = False
+        self.tags[m] = 0
+        self.first_tag[m] = -1
+        self.frame[m] = 0
+        self.done[m] = False
+        self.portal_pos[m] = self._portal_positions(k)
+        self.portal_active[m] = True
+        self.portal_cooldown[m] = 0
+
+    def _span_points(self, k):
+        spans = self.spans[self.rng.integers(0, len(self.spans), k)]
+        x = self.rng.integers(spans[:, 0] + 20, spans[:, 1] - 20, endpoint=True)
+        return spans, x
+
+    def _portal_positions(self, k):
+        out = np.zeros((k, 2, 2), np.int64)
+        for i in range(2):
+            spans, x = self._span_points(k)
+            out[:, i, 0] = x
+            out[:, i, 1] = spans[:, 2] - 15
+        return out
+
+    def _spawn_buffs(self, m, gravity):
+        # one new buff in the first free slot of every selected match
+        idx = np.nonzero(m & ~self.buff_alive.all(axis=1))[0]
+        if len(idx) == 0:
+            return
+        slot = np.argmin(self.buff_alive[idx], axis=1)
+        spans, x = self._span_points(len(idx))
+        y = spans[:, 2] - 20 if gravity >= 0 else spans[:, 3] + 20
+        y = np.clip(y, BUFF_RADIUS, self.height - BUFF_RADIUS)
+        self.buff_alive[idx, slot] = True
+        self.buff_x[idx, slot] = x
+        self.buff_y[idx, slot] = y
+        self.buff_type[idx, slot] = self.rng.integers(0, len(BUFF_TYPES), len(idx))
+        self.buff_bob[idx, slot] = self.rng.uniform(0, 2 * np.pi, len(idx))
+        self.buffs_spawned[idx] += 1
+
+    # --- COLLISION ---
+    def _overlaps(self, x, y, w, h):
+        # (..., boxes) interior overlap between player rects and every platform
+        b = self.boxes
+        return ((x[..., None] < b[:, 2]) & (x[..., None] + w[..., None] > b[:, 0]) &
+                (y[..., None] < b[:, 3]) & (y[..., None] + h[..., None] > b[:, 1]))
+
+    def _lift_to_clear(self, x, y, w, h, start, limit):
+        # smallest upward lift >= start that clears every platform, capped just above limit
+        lift = np.full(x.shape, start, np.int64)
+        for _ in range(len(self.boxes) + 1):
+            hit = self._overlaps(x, y - lift, w, h)
+            needed = np.where(hit, (y + h)[..., None] - self.boxes[:, 1], 0).max(axis=-1, initial=0)
+            grow = hit.any(axis=-1) & (lift <= limit)
+            if not grow.any():
+                break
+            lift = np.where(grow, np.maximum(lift + 1, needed), lift)
+        return lift
+
+    def _sweep_y(self, x, y, w, h, dist):
+        # whole pixels the rect can move by signed dist before entering a platform
+        b = self.boxes
+        xo = (x[..., None] < b[:, 2]) & (x[..., None] + w[..., None] > b[:, 0])
+        top, bottom = y[..., None], (y + h)[..., None]
+        inside = (top < b[:, 3]) & (bottom > b[:, 1])
+        down = (dist > 0)[..., None]
+        gap = np.where(down,
+                       np.where(b[:, 1] >= bottom, b[:, 1] - bottom, -1),
+                       np.where(b[:, 3] <= top, top - b[:, 3], -1))
+        allowed = np.where(inside, 0, np.where(gap >= 0, gap, np.iinfo(np.int64).max))
+        allowed = np.where(xo, allowed, np.iinfo(np.int64).max).min(axis=-1, initial=np.iinfo(np.int64).max)
+        limit = np.abs(dist)
+        return np.minimum(limit, allowed), allowed < limit
+
+    def _resolve(self, dx, active):
+        # vectorized resolve_collision for every player that is not teleporting
+        x, y, w, h = self.x, self.y, self.w, self.h
+
+        # --- HORIZONTAL MOVE ---
+        moving = active & (dx != 0)
+        nx = np.where(moving, _pg_round(x + dx), x)
+        blocked = moving & self._overlaps(nx, y, w, h).any(axis=-1)
+        lift = self._lift_to_clear(nx, y, w, h, 1, STEP_HEIGHT)
+        stepped = blocked & (lift <= STEP_HEIGHT)
+        nx = np.where(blocked & ~stepped, _pg_round(nx - dx), nx)
+        ny = np.where(stepped, y - lift, y)
+
+        # --- VERTICAL MOVE ---
+        vy = self.vel_y + self.gravity
+        vy = np.minimum(vy, self.max_fall)
+        max_jump = np.maximum(np.abs(self.jump), self.max_fall)
+        vy = np.maximum(vy, -max_jump)
+        step = np.maximum(np.trunc(np.abs(vy)).astype(np.int64), 1)
+        sign = np.where(vy > 0, 1, -1)
+        moved, hit = self._sweep_y(nx, ny, w, h, step * sign)
+
+        self.x = np.where(active, nx, x)
+        self.y = np.where(active, ny + moved * sign, y)
+        self.vel_y = np.where(active & hit, 0.0, np.where(active, vy, self.vel_y))
+        self.on_ground = np.where(active, hit & (sign > 0), self.on_ground)
+        self.on_ceiling = np.where(active, hit & (sign < 0), self.on_ceiling)
+
+    # --- BUFFS ---
+    def _set_size(self, m, p, size_w, size_h):
+        # resize keeping the horizontal center and the side the player stands on
+        # (bottom, or top under flipped gravity), like sim.resize_player
+        cx = self.x[m, p] + self.w[m, p] // 2
+        bottom = self.y[m, p] + self.h[m, p]
+        self.w[m, p] = size_w
+        self.h[m, p] = size_h
+        self.x[m, p] = cx - size_w // 2
+        if self.gravity >= 0:
+            self.y[m, p] = bottom - size_h
+
+    def _unstick(self, x, y, w, h):
+        # LevelCollision.unstick for boxes: per axis, the push that clears every box the
+        # rect overlaps is the deepest penetration; it counts if it fits within the rect's
+        # size and lands clear of every other box. Returns (found, dx, dy).
+        b = self.boxes
+        hit = self._overlaps(x, y, w, h)
+        up = -1 if self.gravity >= 0 else 1
+        best = np.full(x.shape, np.iinfo(np.int64).max)
+        dx_out = np.zeros_like(x)
+        dy_out = np.zeros_like(y)
+        for dx, dy in ((0, up), (-1, 0), (1, 0), (0, -up)):
+            if dy < 0:
+                pen = (y + h)[..., None] - b[:, 1]
+            elif dy > 0:
+                pen = b[:, 3] - y[..., None]
+            elif dx < 0:
+                pen = (x + w)[..., None] - b[:, 0]
+            else:
+                pen = b[:, 2] - x[..., None]
+            d = np.where(hit, pen, 0).max(axis=-1, initial=0)
+            fits = (d <= (h if dy else w)) & ~self._overlaps(x + dx * d, y + dy * d, w, h).any(axis=-1)
+            take = fits & (d < best)
+            best = np.where(take, d, best)
+            dx_out = np.where(take, dx * d, dx_out)
+            dy_out = np.where(take, dy * d, dy_out)
+        return best != np.iinfo(np.int64).max, dx_out, dy_out
+
+    @staticmethod
+    def _stacked(value, count, factor):
+        # value multiplied by factor once per stack, one at a time like derive_stats
+        for i in range(int(count.max(initial=0))):
+            value = np.where(count > i, value * factor, value)
+        return value
+
+    def _update_stats(self, m, p):
+        # derive player p's stats from the pickups it holds (and the enemy's freezes),
+        # like sim.derive_stats does from the modifier stack
+        held = (self.buff_timer[m, p] > 0).sum(axis=-1)
+        freezes = (self.buff_timer[m, 1 - p, FREEZE] > 0).sum(axis=-1)
+        speed = self._stacked(np.full(len(held), self.base_speed), held[:, SPEED], self.speed_mult)
+        self.speed[m, p] = self._stacked(speed, freezes, self.slow_factor)
+        self.jump[m, p] = self._stacked(np.full(len(held), self.base_jump), held[:, JUMP], self.jump_mult)
+        self.shield[m, p] = held[:, SHIELD] > 0
+        self.frozen[m, p] = freezes > 0
+
+        idx = np.nonzero(m)[0]
+        size_w = self.base_size + held[:, SIZE] * self.inflate[0]
+        size_h = self.base_size + held[:, SIZE] * self.inflate[1]
+        grew = (size_w > self.w[idx, p]) | (size_h > self.h[idx, p])
+        before = [a[idx, p] for a in (self.x, self.y, self.w, self.h)]
+        self._set_size(m, p, size_w, size_h)
+        if grew.any():
+            # push out of the level after growing, or stay small if there is no room
+            g = idx[grew]
+            x, y, w, h = self.x[g, p], self.y[g, p], self.w[g, p], self.h[g, p]
+            found, dx, dy = self._unstick(x, y, w, h)
+            for a, new, old in zip((self.x, self.y, self.w, self.h), (x + dx, y + dy, w, h), before):
+                a[g, p] = np.where(found, new, old[grew])
+
+    def _update_buffs(self, live):
+        ticks = self.frame * 1000 / FPS
+        self.buff_y += np.sin(ticks[:, None] * 0.005 + self.buff_bob) * 0.5 * live[:, None]
+
+        counting = (self.buff_timer > 0) & live[:, None, None, None]
+        self.buff_timer -= counting
+        expired = (counting & (self.buff_timer == 0)).any(axis=-1)
+        if expired.any():
+            for p in range(PLAYERS):
+                for t in range(len(BUFF_TYPES)):
+                    m = expired[:, p, t]
+                    if m.any():
+                        self._update_stats(m, p)
+                        if t == FREEZE:
+                            self._update_stats(m, 1 - p)
+
+    def _stack(self, m, p, t):
+        # start a timer for one more pickup of type t, in the first stack slot not in use
+        free = self.buff_timer[m, p, t] == 0
+        if not free.any(axis=-1).all():
+            self.buff_timer = np.concatenate((self.buff_timer, np.zeros_like(self.buff_timer)), axis=-1)
+            free = self.buff_timer[m, p, t] == 0
+        self.buff_timer[np.nonzero(m)[0], p, t, free.argmax(axis=-1)] = self.durations[t]
+
+    def _pickups(self, live):
+        bl = np.trunc(self.buff_x - BUFF_RADIUS)
+        bt = np.trunc(self.buff_y - BUFF_RADIUS)
+        for p in range(PLAYERS):
+            for s in range(BUFF_SLOTS):
+                x, y, w, h = self.x[:, p], self.y[:, p], self.w[:, p], self.h[:, p]
+                got = (live & self.buff_alive[:, s] &
+                       (x < bl[:, s] + 2 * BUFF_RADIUS) & (x + w > bl[:, s]) &
+                       (y < bt[:, s] + 2 * BUFF_RADIUS) & (y + h > bt[:, s]))
+                if not got.any():
+                    continue
+                self.buff_alive[got, s] = False
+                for t in range(len(BUFF_TYPES)):
+                    m = got & (self.buff_type[:, s] == t)
+                    if m.any():
+                        self._stack(m, p, t)
+                        self._update_stats(m, p)
+                        if t == FREEZE:
+                            self._update_stats(m, 1 - p)
+
+    # --- PORTALS ---
+    def _portals(self, live):
+        pos = self.portal_pos
+        for p in range(PLAYERS):
+            cx = self.x[:, p] + self.w[:, p] // 2
+            cy = self.y[:, p] + self.h[:, p] // 2
+
+            tele = live & self.teleport_active[:, p]
+            self.teleport_progress[tele, p] += 0.02
+            arrived = tele & (self.teleport_progress[:, p] >= 1)
+            gliding = tele & ~arrived
+            tx, ty = self.teleport_target[:, p, 0], self.teleport_target[:, p, 1]
+            new_cx = np.where(arrived, tx, np.where(gliding, _pg_round(cx + (tx - cx) * 0.1), cx))
+            self.x[:, p] += new_cx - cx
+            cy_now = self.y[:, p] + self.h[:, p] // 2
+            new_cy = np.where(arrived, ty, np.where(gliding, _pg_round(cy_now + (ty - cy_now) * 0.1), cy_now))
+            self.y[:, p] += new_cy - cy_now
+            self.teleport_active[arrived, p] = False
+            self.teleport_progress[arrived, p] = 0
+
+            ready = live & ~tele & self.portal_active
+            dist = np.hypot(cx[:, None] - pos[:, :, 0], cy[:, None] - pos[:, :, 1])
+            near = ready[:, None] & (dist < PORTAL_RADIUS + self.w[:, p, None] // 2)
+            enter = near.any(axis=1)
+            if enter.any():
+                other = np.where(near[:, 0], 1, 0)
+                rows = np.nonzero(enter)[0]
+                self.teleport_active[rows, p] = True
+                self.teleport_progress[rows, p] = 0
+                self.teleport_target[rows, p, 0] = pos[rows, other[rows], 0]
+                self.teleport_target[rows, p, 1] = pos[rows, other[rows], 1] - 30
+                self.portal_active[rows] = False
+                self.portal_cooldown[rows] = FPS * 10
+
+        waiting = live & ~self.portal_active
+        counting = waiting & (self.portal_cooldown > 0)
+        self.portal_cooldown[counting] -= 1
+        respawn = np.nonzero(waiting & ~counting)[0]
+        if len(respawn):
+            self.portal_pos[respawn] = self._portal_positions(len(respawn))
+            self.portal_active[respawn] = True
+
+    # --- STEP ---
+    def step(self, inputs):
+        # inputs: (n, PLAYERS) array of INPUT_* bitmasks. Finished matches are frozen
+        # until reset(); returns the done mask.
+        inputs = np.asarray(inputs)
+        live = ~self.done
+        n = self.n
+
+        roll = self.rng.random(n)
+        self._spawn_buffs(live & (roll < 0.01) & (self.buff_alive.sum(axis=1) < MAX_ACTIVE_BUFFS), self.gravity)
+
+        self._update_buffs(live)
+        self._pickups(live)
+
+        roll = self.rng.random(n)
+        self._spawn_buffs(live & (roll < 0.005) & (self.buffs_spawned < 3), 0.5)
+
+        left = (inputs & INPUT_LEFT) != 0
+        right = (inputs & INPUT_RIGHT) != 0
+        jump = ((inputs & INPUT_JUMP) != 0) & live[:, None]
+        dx = np.where(left, -self.speed, np.where(right, self.speed, 0.0))
+        if self.gravity > 0:
+            go = jump & self.on_ground
+            self.vel_y[go] = -np.abs(self.jump[go])
+            self.on_ground[go] = False
+        elif self.gravity < 0:
+            go = jump & self.on_ceiling
+            self.vel_y[go] = np.abs(self.jump[go])
+            self.on_ceiling[go] = False
+
+        moving = live[:, None] & ~self.teleport_active
+        self._resolve(dx, moving)
+        self.on_ground &= ~(live[:, None] & self.teleport_active)
+
+        # clamp
+        self.x = np.clip(self.x, 0, self.width - self.w)
+        self.y = np.clip(self.y, 0, self.height - self.h)
+
+        # --- Tagging with shield logic ---
+        x, y, w, h = self.x, self.y, self.w, self.h
+        touching = ((x[:, 0] < x[:, 1] + w[:, 1]) & (x[:, 1] < x[:, 0] + w[:, 0]) &
+                    (y[:, 0] < y[:, 1] + h[:, 1]) & (y[:, 1] < y[:, 0] + h[:, 0]))
+        fresh = live & touching & self.tagging
+        self.tagging[fresh] = False
+        tagged = 1 - self.tagger
+        swap = fresh & ~self.shield[np.arange(n), tagged]
+        self.tagger = np.where(swap, tagged, self.tagger)
+        self.tags += swap
+        self.first_tag = np.where(swap & (self.first_tag < 0), self.frame, self.first_tag)
+        self.tagging |= live & ~touching
+
+        # update time
+        self.frame += live
+        self.done |= self.frame >= self.round_frames
+
+        self._portals(live)
+        return self.done
+
+    @property
+    def winner(self):
+        return 1 - self.tagger
+
+
+def random_inputs(rng, n):
+    held = rng.choice(np.array([0, INPUT_LEFT, INPUT_RIGHT]), size=(n, PLAYERS))
+    jump = (rng.random((n, PLAYERS)) < 0.1) * INPUT_JUMP
+    return held | jump
+
+
+def play_random(sim, seed=None):
+    # run every match to the end with key-mashing players, returns the frames stepped
+    rng = np.random.default_rng(seed)
+    held = random_inputs(rng, sim.n)
+    steps = 0
+    while not sim.done.all():
+        change = rng.random((sim.n, PLAYERS)) < 0.05
+        held = np.where(change, random_inputs(rng, sim.n), held)
+        sim.step(held)
+        steps += 1
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many tag matches at once with numpy.")
+    parser.add_argument("--level", type=int, default=0)
+    parser.add_argument("--matches", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--round-time", type=int, default=ROUND_TIME)
+    args = parser.parse_args()
+
+    sim = BatchSim(args.matches, level=args.level, seed=args.seed, round_time=args.round_time)
+    start = time.perf_counter()
+    steps = play_random(sim, args.seed)
+    elapsed = time.perf_counter() - start
+    frames = steps * args.matches
+    print(f"level {args.level}: {args.matches} matches x {steps} frames in {elapsed:.2f}s "
+          f"({frames / elapsed:.0f} match-frames/s)")
+    wins = np.bincount(sim.winner, minlength=PLAYERS)
+    print(f"wins p1/p2: {wins[0]}/{wins[1]}, tags per match: {sim.tags.mean():.2f}")
+
+
+if __name__ == "__main__":
+    main()
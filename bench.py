@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pygame
+
+import sim
+from collision import resolve_collision
+from bots import bot_policy
+from env import ACTIONS, PLAYERS, TagVectorEnv
+from hud import Hud
+from render import Renderer
+from sim import WIDTH, HEIGHT, BuffPool, GameState, buff_defs, level_configs, random_policy
+
+# Benchmarks for the hot paths, all with fixed seeds so runs are comparable:
+#   collision/*  resolve_collision walking and jumping on every level (incl. inverted gravity)
+#   size/*       picking up and losing a size buff, i.e. the nudge-out-of-the-floor path
+#   pickup/*     GameState._check_pickup with lots of buffs lying around
+#   step/*       one full headless frame of GameState.step (2, 8 and 16 players)
+#   frame/*      step plus drawing it with the Renderer onto an offscreen surface
+#   bots/*       step with every player driven by bots.py (compare with step/* for the bots' share)
+#   env/*        one TagVectorEnv step of 256 rounds (x256 for env-steps/s)
+#   synthetic/*  the same on generated levels with 10, 100 and 1000 platforms, and on
+#                one ten windows wide
+#
+#   python bench.py                  run and compare with bench_baseline.json
+#   python bench.py --save           run and store the results as the new baseline
+#   python bench.py -k collision     only cases whose name contains "collision"
+#
+# A case is a regression when its ops/s drops more than --tolerance below the baseline,
+# or its peak or retained memory grows more than --mem-tolerance (plus a little slack,
+# as tiny numbers jitter) above it. Swept and --mask-collision runs keep separate
+# baselines. The baseline is machine specific, so save one on the machine that runs
+# the check.
+
+BASELINE_PATH = "bench_baseline.json"
+SEED = 1234
+PEAK_SLACK_KB = 16       # peak memory growth always allowed on top of --mem-tolerance
+RETAINED_SLACK_B = 64    # same for bytes kept per op
+
+
+# --- LEVELS ---
+def synthetic_level(n, seed=SEED, width=WIDTH):
+    # floor plus n-1 floating platforms, kept clear of the spawn point in the middle
+    rng = random.Random(seed)
+    objects = [[(0, HEIGHT - 100), (0, HEIGHT), (width, HEIGHT), (width, HEIGHT - 100)]]
+    spawn = pygame.Rect(width // 2 - 80, HEIGHT // 2 - 80, 160, 160)
+    while len(objects) < n:
+        w, h = rng.randint(40, 200), rng.randint(10, 40)
+        x, y = rng.randint(0, width - w), rng.randint(150, HEIGHT - 150)
+        if spawn.colliderect(pygame.Rect(x, y, w, h)):
+            continue
+        objects.append([(x, y), (x, y + h), (x + w, y + h), (x + w, y)])
+    config = dict(level_configs[2])
+    config["objects"] = objects
+    config["width"] = width
+    return config
+
+
+# --- CASES ---
+# each case takes an iteration count and returns a function that runs that many ops
+def case_collision(config):
+    def setup(n):
+        state = GameState(config=config, seed=SEED)
+        player = state.players[0]
+        rng = random.Random(SEED)
+        moves = [(rng.choice((-1, 0, 1)) * player.stats["speed"], rng.random() < 0.1) for _ in range(n)]
+        lc, gravity = state.level_collision, state.gravity
+        max_jump = max(abs(player.stats["jump"]), player.max_fall)  # as GameState._move_player
+
+        def run():
+            rect, mask = player.rect, player.mask
+            vel, on_ground, on_ceiling = 0, False, False
+            for dx, jump in moves:
+                if jump and (on_ground or on_ceiling):
+                    vel = -player.stats["jump"] if gravity > 0 else player.stats["jump"]
+                _, vel, on_ground, on_ceiling = resolve_collision(rect, mask, lc, dx, vel, gravity, player.max_fall, max_jump=max_jump)
+                rect.clamp_ip(state.world_rect)
+        return run
+    return setup
+
+
+def case_size(config):
+    def setup(n):
+        state = GameState(config=config, seed=SEED)
+        player = state.players[0]
+        # settle on the floor (or ceiling) first so growing has to push out of it
+        for _ in range(200):
+            state._move_player(player, 0)
+        buff = state.buffs.acquire()
+        buff.config = buff_defs["size"]
+
+        def run():
+            for _ in range(n):
+                state._apply_buff(buff, player)
+                state._remove_buff(buff)
+        return run
+    return setup
+
+
+def case_pickup(config, count):
+    def setup(n):
+        state = GameState(config=config, seed=SEED)
+        rng = random.Random(SEED)
+        names = list(buff_defs)
+        state.buffs = BuffPool(count)
+        for _ in range(count):
+            buff = state.buffs.acquire()
+            name = rng.choice(names)
+            buff.pos[:] = rng.randint(0, WIDTH), rng.randint(0, HEIGHT)
+            buff.type_name, buff.active, buff.config = name, True, buff_defs[name]
+            # park the players where nothing is, so every call scans every buff
+            if abs(buff.pos[0] - 20) >= 100 or abs(buff.pos[1] - 20) >= 100:
+                state.buffs.add(buff)
+        for player in state.players:
+            player.rect.topleft = (0, 0)
+
+        def run():
+            for _ in range(n):
+                for player in state.players:
+                    state._check_pickup(player)
+        return run
+    return setup
+
+
+def case_step(config, render=False, players=2, bots=False):
+    def setup(n):
+        state = GameState(config=config, seed=SEED, round_time=10 ** 6, players=players)
+        if bots:
+            policy = bot_policy(random.Random(SEED), players)
+            policy(state)  # build the nav graph outside the timing
+        else:
+            policy = random_policy(random.Random(SEED), players)
+        if render:
+            renderer = _offscreen_renderer(state)
+
+        def run():
+            for _ in range(n):
+                state.step(policy(state))
+                if render:
+                    renderer.last_rects = renderer.draw(state)
+        return run
+    return setup
+
+
+def case_env(level, envs):
+    def setup(n):
+        env = TagVectorEnv(envs, level, seed=SEED)
+        env.reset()
+        actions = np.random.default_rng(SEED).integers(0, len(ACTIONS), (64, envs, PLAYERS))
+
+        def run():
+            for i in range(n):
+                env.step(actions[i % 64])
+        return run
+    return setup
+
+
+def _offscreen_renderer(state):
+    if not pygame.font.get_init():
+        pygame.font.init()
+    frames = [pygame.Surface((60, 60), pygame.SRCALPHA) for _ in range(8)]
+    buffs = {name: pygame.Surface((60, 60), pygame.SRCALPHA) for name in buff_defs}
+    target = pygame.Surface((WIDTH, HEIGHT))
+    font = pygame.font.Font(None, 50)
+    renderer = Renderer(target, state.objects, frames, buffs, font, world_size=state.world_rect.size)
+    renderer.hud = Hud(font, pygame.font.Font(None, 24), buffs)
+    renderer.redraw_all()
+    return renderer
+
+
+def build_cases():
+    cases = {}
+    for i, config in enumerate(level_configs):
+        cases[f"collision/level{i}"] = (case_collision(config), 2000)
+        cases[f"size/level{i}"] = (case_size(config), 200)
+        cases[f"step/level{i}"] = (case_step(config), 1000)
+    cases["pickup/level2 x100 buffs"] = (case_pickup(level_configs[2], 100), 200)
+    cases["pickup/level2 x1000 buffs"] = (case_pickup(level_configs[2], 1000), 20)
+    cases["frame/level2"] = (case_step(level_configs[2], render=True), 300)
+    cases["step/level2 x8 players"] = (case_step(level_configs[2], players=8), 300)
+    cases["step/level2 x16 players"] = (case_step(level_configs[2], players=16), 200)
+    cases["frame/level2 x16 players"] = (case_step(level_configs[2], render=True, players=16), 100)
+    cases["bots/level2 x8 players"] = (case_step(level_configs[2], players=8, bots=True), 300)
+    for n in (10, 100, 1000):
+        config = synthetic_level(n)
+        cases[f"synthetic/{n} collision"] = (case_collision(config), 2000)
+        cases[f"synthetic/{n} step"] = (case_step(config), 500)
+    cases["env/level2 x256 rounds"] = (case_env(2, 256), 300)
+    cases["bots/synthetic 100 x8 players"] = (case_step(synthetic_level(100), players=8, bots=True), 300)
+    # ten windows wide, with the camera scrolling after the players
+    config = synthetic_level(1000, width=WIDTH * 10)
+    cases["synthetic/wide step"] = (case_step(config, players=8), 300)
+    cases["synthetic/wide frame"] = (case_step(config, render=True, players=8), 100)
+    return cases
+
+
+# --- RUNNING ---
+def measure(setup, iterations, repeats):
+    # best-of-N ops/s, then one traced run for allocations
+    best = 0.0
+    for _ in range(repeats):
+        run = setup(iterations)
+        start = time.perf_counter()
+        run()
+        best = max(best, iterations / (time.perf_counter() - start))
+
+    run = setup(iterations)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return {"ops_per_s": round(best, 1), "peak_kb": round(peak / 1024, 1),
+            "retained_b_per_op": round(retained / iterations, 1)}
+
+
+def read_baseline(path):
+    # {"swept": {case: result}, "mask": {...}}; older files were one flat swept baseline
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        stored = json.load(f)
+    if stored and not {"swept", "mask"} & set(stored):
+        stored = {"swept": stored}
+    return stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark physics, collision and rendering hot paths.")
+    parser.add_argument("-k", dest="filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every case's iteration count")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed ops/s drop, 0.25 = 25%%")
+    parser.add_argument("--mem-tolerance", type=float, default=0.5,
+                        help="allowed peak / retained memory growth, 0.5 = 50%%")
+    parser.add_argument("--mask-collision", action="store_true", help="bench with SWEPT_COLLISION off")
+    args = parser.parse_args()
+
+    if args.mask_collision:
+        sim.SWEPT_COLLISION = False
+    mode = "mask" if args.mask_collision else "swept"
+    stored = read_baseline(args.baseline)
+    baseline = {} if args.save else stored.get(mode, {})
+
+    results = {}
+    regressions = []
+    print(f"{'case':<28}{'ops/s':>12}{'peak KB':>10}{'B/op kept':>11}{'vs base':>9}")
+    for name, (setup, iterations) in build_cases().items():
+        if args.filter not in name:
+            continue
+        result = measure(setup, max(1, int(iterations * args.scale)), args.repeats)
+        results[name] = result
+        change = ""
+        if name in baseline:
+            base = baseline[name]
+            ratio = result["ops_per_s"] / base["ops_per_s"]
+            change = f"{(ratio - 1) * 100:+.0f}%"
+            found = []
+            if ratio < 1 - args.tolerance:
+                found.append(f"{ratio:.0%} of baseline ops/s")
+            for key, unit, slack in (("peak_kb", "KB peak", PEAK_SLACK_KB),
+                                     ("retained_b_per_op", "B/op kept", RETAINED_SLACK_B)):
+                limit = base.get(key, 0) * (1 + args.mem_tolerance) + slack
+                if result[key] > limit:
+                    found.append(f"{result[key]} {unit}, baseline {base.get(key, 0)}")
+            if found:
+                regressions.append((name, found))
+                change += " !!"
+        print(f"{name:<28}{result['ops_per_s']:>12.1f}{result['peak_kb']:>10.1f}"
+              f"{result['retained_b_per_op']:>11.1f}{change:>9}")
+
+    if args.save:
+        stored[mode] = {**stored.get(mode, {}), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=1, sort_keys=True)
+        print(f"saved {mode} baseline to {args.baseline}")
+    if regressions:
+        print(f"\nREGRESSIONS (ops/s down more than {args.tolerance:.0%} or memory up more than "
+              f"{args.mem_tolerance:.0%}, {mode} collision):")
+        for name, found in regressions:
+            print(f"  {name}: {'; '.join(found)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
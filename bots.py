@@ -0,0 +1,522 @@
+import argparse
+import bisect
+import heapq
+import math
+import random
+import statistics
+import time
+from collections import OrderedDict
+
+import pygame
+
+from collision import spawn_span
+from sim import FPS, PORTAL_RADIUS, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, GameState, player_mask
+
+# CPU players. Each level gets a navigation graph, built once from its polygons and
+# physics settings: nodes are spots a player can stand on, spaced NODE_SPACING apart
+# along every surface, and edges are the ways between them:
+#   WALK         to the next node on the same surface
+#   JUMP         a jump arc that lands on another surface, steering from the start
+#   JUMP_LATE    the same, but going straight up first and steering at the end
+#   DROP         walking off the end of a surface and falling onto another
+#   PORTAL       into a portal and out of the other one (changes as portals move)
+# Edge costs are in frames. Routes come from distance fields, one Dijkstra run
+# backwards from a goal node, cached per goal; portal links are laid over the fixed
+# graph at query time, so moving portals only costs the fields of the new portals.
+#
+# A chaser heads for the nearest player it can tag. An evader makes for the node
+# furthest from the tagger among those it gets to first, and up close runs away,
+# or jumps over the tagger when cornered.
+#
+#   python bots.py --level 2 --players 4     play rounds bot against bot, with timings
+
+NODE_SPACING = 48
+ARC_FRAMES = FPS * 5  # longest jump or fall that gets simulated
+ARC_CHECK_EVERY = 2  # frames between collision checks along an arc
+PORTAL_COST = 60  # frames: the teleport animation plus landing
+FIELD_CACHE = 64  # distance fields kept per graph (least recently used go first)
+GRAPH_CACHE = 8  # levels whose graph is kept around
+STUCK_FRAMES = FPS // 2  # no progress for this long and a bot jumps to get loose
+CHASE_RANGE = 3  # player sizes: closer than this, bots go straight for (or away from) each other
+EVADE_MARGIN = FPS // 4  # frames an evader wants to be ahead of the tagger at its goal
+REPLAN_FRAMES = FPS // 4  # how long an evader sticks to a goal
+ARC_TRIES = 3  # take-off nodes tried per end of a surface before giving up on jumping to it
+UNREACHABLE = float("inf")
+
+WALK, JUMP, JUMP_LATE, DROP, PORTAL = range(5)
+
+
+# --- ARCS ---
+def arc(vel, gravity, max_fall, max_jump, frames=ARC_FRAMES):
+    # foot offsets (world y, relative to the start) after each frame of free flight,
+    # stepped exactly like resolve_collision does it
+    offsets = []
+    y = 0
+    for _ in range(frames):
+        vel += gravity
+        vel = min(vel, max_fall)
+        vel = max(vel, -max_jump)
+        step = int(abs(vel)) or 1
+        y += step if vel > 0 else -step
+        offsets.append(y)
+    return offsets
+
+
+class Arc:
+    # a jump (or fall) seen as height above the start, positive away from gravity.
+    # landing(rise) is the frame it comes down through that height, or None
+    def __init__(self, offsets, down):
+        self.heights = [-down * y for y in offsets]
+        self.apex = max(range(len(self.heights)), key=self.heights.__getitem__)
+        # from the apex on the arc only goes down, so flip it for bisect
+        self.falling = [-h for h in self.heights[self.apex:]]
+        self.top = self.heights[self.apex]
+
+    def landing(self, rise):
+        if rise > self.top:
+            return None
+        i = bisect.bisect_left(self.falling, -rise)
+        if i >= len(self.falling):
+            return None
+        return self.apex + i + 1  # frames, counted from 1
+
+    def height(self, frame):
+        return self.heights[frame - 1]
+
+
+# --- NAV GRAPH ---
+class NavGraph:
+    def __init__(self, level_collision, objects, config, width):
+        gravity = config["gravity"]
+        self.down = 1 if gravity > 0 else -1
+        self.size = size = config["playerSize"]
+        self.speed = speed = config["playerSpeed"]
+        self.level = level_collision
+        self.width = width
+        self.mask = player_mask(size, size)
+        max_fall = config["playerMaxFall"]
+        max_jump = max(abs(config["playerJump"]), max_fall)
+        self.jump_arc = Arc(arc(-self.down * abs(config["playerJump"]), gravity, max_fall, max_jump), self.down)
+        self.drop_arc = Arc(arc(0, gravity, max_fall, max_jump), self.down)
+
+        self.nodes = []  # (center x, foot y, surface)
+        self.surfaces = []  # (left, right, foot y, node xs with None for blocked spots, node indices)
+        self.node_xs = []  # surface -> x of each of its nodes
+        self.by_foot = {}  # foot y -> surface indices
+        self._add_surfaces(objects)
+        self.edges = [[] for _ in self.nodes]  # node -> [(to, cost, kind, frames)]
+        self._add_walks()
+        self._add_arcs()
+        self.incoming = [[] for _ in self.nodes]
+        for u, out in enumerate(self.edges):
+            for v, cost, _, _ in out:
+                self.incoming[v].append((u, cost))
+
+        self.fields = OrderedDict()  # goal node -> distance of every node to it
+        self.portals = None  # positions the portal links below were made for
+        self.portal_links = []  # (entry node, exit node, portal x)
+        self.field_builds = 0
+
+    def _standing_rect(self, x, foot):
+        y = foot - self.size if self.down > 0 else foot
+        return pygame.Rect(round(x - self.size / 2), y, self.size, self.size)
+
+    def _add_surfaces(self, objects):
+        # the side of every polygon facing away from gravity, with touching ones merged
+        spans = {}
+        for verts in objects:
+            left, right, top, bottom = spawn_span(verts)
+            # (polygon fills include their last row, so under a ceiling the foot is one lower)
+            spans.setdefault(top if self.down > 0 else bottom + 1, []).append((left, right))
+        for foot, xs in sorted(spans.items()):
+            xs.sort()
+            merged = [list(xs[0])]
+            for left, right in xs[1:]:
+                if left <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], right)
+                else:
+                    merged.append([left, right])
+            for left, right in merged:
+                self._add_surface(left, right, foot)
+
+    def _add_surface(self, left, right, foot):
+        half = self.size / 2
+        lo, hi = max(left + half, half), min(right - half, self.width - half)
+        if hi < lo:
+            return
+        count = max(1, math.ceil((hi - lo) / NODE_SPACING))
+        surface = len(self.surfaces)
+        xs, indices = [], []
+        for i in range(count + 1):
+            x = round(lo + (hi - lo) * i / count)
+            rect = self._standing_rect(x, foot)
+            # skip spots inside other geometry or with nothing to stand on
+            if self.level.overlaps(rect, self.mask) or not self.level.overlaps(rect.move(0, self.down), self.mask):
+                xs.append(None)
+                continue
+            xs.append(x)
+            indices.append(len(self.nodes))
+            self.nodes.append((x, foot, surface))
+        if not indices:
+            return
+        self.surfaces.append((left, right, foot, xs, indices))
+        self.node_xs.append([x for x in xs if x is not None])
+        self.by_foot.setdefault(foot, []).append(surface)
+
+    def _add_walks(self):
+        for _, _, _, xs, indices in self.surfaces:
+            # only neighbours with no blocked spot between them
+            node = iter(indices)
+            prev = None
+            for x in xs:
+                if x is None:
+                    prev = None
+                    continue
+                current = next(node)
+                if prev is not None:
+                    cost = abs(self.nodes[current][0] - self.nodes[prev][0]) / self.speed
+                    self.edges[prev].append((current, cost, WALK, 0))
+                    self.edges[current].append((prev, cost, WALK, 0))
+                prev = current
+
+    def _clear_path(self, x0, foot0, x1, shape, frames, late):
+        # does the player fly from (x0, foot0) to x1 along this arc without hitting anything?
+        dist = abs(x1 - x0)
+        sign = 1 if x1 > x0 else -1
+        for t in range(1, frames, ARC_CHECK_EVERY):
+            if late:
+                moved = max(0, dist - self.speed * (frames - t))
+            else:
+                moved = min(dist, self.speed * t)
+            foot = foot0 - self.down * shape.height(t)
+            if self.level.overlaps(self._standing_rect(x0 + sign * moved, foot), self.mask):
+                return False
+        return True
+
+    def _closest_on(self, surface, x):
+        # node of a surface closest to x
+        xs = self.node_xs[surface]
+        i = bisect.bisect_left(xs, x)
+        best = min((j for j in (i - 1, i) if 0 <= j < len(xs)), key=lambda j: abs(xs[j] - x))
+        return self.surfaces[surface][4][best]
+
+    def _add_arc(self, a, x0, surface, shape, frames, kinds, run=0.0):
+        # edge from node a along an arc that starts at x0, if one lands on surface
+        b = self._closest_on(surface, x0)
+        xb, foot_a = self.nodes[b][0], self.nodes[a][1]
+        if abs(xb - x0) > self.speed * frames:
+            return False
+        for kind in kinds:
+            if self._clear_path(x0, foot_a, xb, shape, frames, kind == JUMP_LATE):
+                self.edges[a].append((b, run + max(frames, abs(xb - x0) / self.speed), kind, frames))
+                return True
+        return False
+
+    def _add_arcs(self):
+        half = self.size / 2
+        for sa, (left, right, foot_a, _, nodes_a) in enumerate(self.surfaces):
+            for sb, (_, _, foot_b, _, _) in enumerate(self.surfaces):
+                rise = -self.down * (foot_b - foot_a)
+                frames = self.jump_arc.landing(rise)
+                # further down than a jump goes up is left to the drops
+                if sb == sa or frames is None or rise < -self.jump_arc.top:
+                    continue
+                # jumps only leave from the few nodes nearest either end of the other
+                # surface; walking gets a bot there, and it keeps the graph small
+                xs = self.node_xs[sb]
+                for end in (xs[0], xs[-1]):
+                    nearest = sorted(nodes_a, key=lambda n: abs(self.nodes[n][0] - end))
+                    for a in nearest[:ARC_TRIES]:
+                        if self._add_arc(a, self.nodes[a][0], sb, self.jump_arc, frames, (JUMP, JUMP_LATE)):
+                            break
+            # walking off either end of the surface
+            for a, edge_x, sign in ((nodes_a[0], left, -1), (nodes_a[-1], right, 1)):
+                x0 = edge_x + sign * (half + 1)
+                if not half <= x0 <= self.width - half:
+                    continue
+                run = abs(x0 - self.nodes[a][0]) / self.speed
+                for sb, (_, _, foot_b, _, _) in enumerate(self.surfaces):
+                    rise = -self.down * (foot_b - foot_a)
+                    frames = self.drop_arc.landing(rise) if rise < 0 else None
+                    if frames is not None:
+                        self._add_arc(a, x0, sb, self.drop_arc, frames, (DROP,), run)
+
+    # --- WHERE THINGS ARE ---
+    def node_at(self, rect, standing):
+        # the node a player is on (standing) or will come down on, or None
+        foot = rect.bottom if self.down > 0 else rect.top
+        x = rect.centerx
+        if standing:
+            for s in self.by_foot.get(foot, ()):
+                left, right = self.surfaces[s][:2]
+                if left <= x <= right:
+                    return self._closest_on(s, x)
+        best = None
+        for s, (left, right, foot_s, _, _) in enumerate(self.surfaces):
+            below = (foot_s - foot) * self.down
+            if left <= x <= right and below >= 0 and (best is None or below < best[0]):
+                best = (below, s)
+        return None if best is None else self._closest_on(best[1], x)
+
+    # --- ROUTES ---
+    def field(self, goal):
+        # frames from every node to goal over the fixed graph
+        dist = self.fields.get(goal)
+        if dist is not None:
+            self.fields.move_to_end(goal)
+            return dist
+        dist = [UNREACHABLE] * len(self.nodes)
+        dist[goal] = 0.0
+        heap = [(0.0, goal)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > dist[v]:
+                continue
+            for u, cost in self.incoming[v]:
+                if d + cost < dist[u]:
+                    dist[u] = d + cost
+                    heapq.heappush(heap, (d + cost, u))
+        self.fields[goal] = dist
+        self.field_builds += 1
+        if len(self.fields) > FIELD_CACHE:
+            self.fields.popitem(last=False)
+        return dist
+
+    def update_portals(self, portals):
+        # relink the portals when they moved; fields of the old ones just age out
+        positions = [tuple(p) for p in portals["positions"]] if portals["active"] else None
+        if positions == self.portals:
+            return
+        self.portals = positions
+        self.portal_links = []
+        if positions is None:
+            return
+        rects = [pygame.Rect(0, 0, self.size, self.size) for _ in positions]
+        for rect, (x, y) in zip(rects, positions):
+            rect.center = (x, y)
+        ends = [self.node_at(rect, False) for rect in rects]
+        for i, entry in enumerate(ends):
+            exit_ = ends[1 - i]
+            if entry is None or exit_ is None:
+                continue
+            # the portal has to be touchable from the entry node
+            ex, foot = self.nodes[entry][:2]
+            cy = foot - self.down * self.size / 2
+            if math.dist((ex, cy), positions[i]) < PORTAL_RADIUS + self.size // 2 + NODE_SPACING / 2:
+                self.portal_links.append((entry, exit_, positions[i][0]))
+
+    def route(self, node, goal):
+        # (next node, kind, frames, target x) on the quickest way from node to goal, or None
+        # when there is none; target x is where to steer to (the portal for PORTAL)
+        field = self.field(goal)
+        best, via = field[node], None
+        for link in self.portal_links:
+            entry, exit_, _ = link
+            cost = self.field(entry)[node] + PORTAL_COST + field[exit_]
+            if cost < best:
+                best, via = cost, link
+        if best == UNREACHABLE or node == goal:
+            return None
+        if via is not None:
+            if node == via[0]:
+                return via[1], PORTAL, 0, via[2]
+            field = self.field(via[0])
+        nxt = min(self.edges[node], key=lambda e: e[1] + field[e[0]])
+        return nxt[0], nxt[2], nxt[3], self.nodes[nxt[0]][0]
+
+
+_graphs = OrderedDict()
+
+
+def nav_graph(state):
+    # the graph for a state's level, built on first use and shared between rounds
+    config = state.config
+    key = (id(state.objects), config["gravity"], config["playerJump"], config["playerSpeed"],
+           config["playerMaxFall"], config["playerSize"], state.width)
+    entry = _graphs.get(key)
+    if entry is None:
+        graph = NavGraph(state.level_collision, state.objects, config, state.width)
+        # keep the objects alive too, so their id can't be reused for another level
+        entry = _graphs[key] = (state.objects, graph)
+        if len(_graphs) > GRAPH_CACHE:
+            _graphs.popitem(last=False)
+    else:
+        _graphs.move_to_end(key)
+    return entry[1]
+
+
+# --- BOTS ---
+class Bot:
+    # one CPU player; keys() is called once per frame and returns its INPUT_* bits
+    def __init__(self, index, graph, rng):
+        self.index = index
+        self.graph = graph
+        self.rng = rng
+        self.edge = None  # (to, kind, frames, target x) being followed
+        self.airtime = 0
+        self.goal = None  # evaders keep their goal for REPLAN_FRAMES
+        self.replan_at = 0
+        self.last_pos = None
+        self.still = 0
+
+    def _prey(self, state, me):
+        # the nearest player the tagger can tag (or just the nearest if all are shielded)
+        others = [p for p in state.players if p is not me]
+        open_ = [p for p in others if not p.stats.get("shield", False)] or others
+        return min(open_, key=lambda p: abs(p.rect.centerx - me.rect.centerx) + abs(p.rect.centery - me.rect.centery))
+
+    def _close(self, me, other):
+        close = self.graph.size * CHASE_RANGE
+        return abs(other.rect.centerx - me.rect.centerx) < close and abs(other.rect.centery - me.rect.centery) < close
+
+    def _direct(self, state, me):
+        # keys for close quarters, where the graph is too coarse; None when not close
+        graph = self.graph
+        if state.tagger == self.index:
+            prey = self._prey(state, me)
+            if not self._close(me, prey):
+                return None
+            bits = self._steer(me, prey.rect.centerx, 2)
+            if (me.rect.centery - prey.rect.centery) * graph.down > graph.size:
+                bits |= INPUT_JUMP
+            return bits
+        tagger = state.players[state.tagger]
+        if not self._close(me, tagger):
+            return None
+        away = INPUT_LEFT if tagger.rect.centerx > me.rect.centerx else INPUT_RIGHT
+        here = graph.node_at(me.rect, True)
+        sign = -1 if away == INPUT_LEFT else 1
+        open_side = here is not None and any(
+            kind in (WALK, DROP) and (graph.nodes[to][0] - me.rect.centerx) * sign > 0
+            for to, _, kind, _ in graph.edges[here])
+        if open_side:
+            return away
+        # cornered: jump over the tagger
+        return INPUT_JUMP | (INPUT_RIGHT if away == INPUT_LEFT else INPUT_LEFT)
+
+    def _goal(self, state, me):
+        # node to head for, or None
+        graph = self.graph
+        if state.tagger == self.index:
+            return graph.node_at(self._prey(state, me).rect, False)
+        if self.goal is not None and state.frame < self.replan_at:
+            return self.goal
+        # evade: the node furthest from the tagger among those we would get to first
+        here = graph.node_at(me.rect, False)
+        there = graph.node_at(state.players[state.tagger].rect, False)
+        if here is None or there is None:
+            return None
+        away = graph.field(there)
+        mine = graph.field(here)
+        ahead = [n for n in range(len(graph.nodes)) if mine[n] + EVADE_MARGIN < away[n]]
+        self.goal = max(ahead or [here], key=lambda n: away[n])
+        self.replan_at = state.frame + REPLAN_FRAMES
+        return self.goal
+
+    def keys(self, state):
+        me = state.players[self.index]
+        if me.teleport["active"]:
+            return 0
+        graph = self.graph
+        standing = me.on_ground if graph.down > 0 else me.on_ceiling
+        bits = 0
+        if standing:
+            self.airtime = 0
+            self.edge = None
+            direct = self._direct(state, me)
+            if direct is not None:
+                bits = direct
+            else:
+                goal = self._goal(state, me)
+                node = graph.node_at(me.rect, True)
+                if node is not None and goal is not None:
+                    self.edge = graph.route(node, goal)
+                if self.edge is None:
+                    if goal is not None:
+                        bits = self._steer(me, graph.nodes[goal][0])
+                else:
+                    _, kind, _, target_x = self.edge
+                    start_x = graph.nodes[node][0]
+                    if kind not in (JUMP, JUMP_LATE):
+                        bits = self._steer(me, target_x)
+                    elif abs(me.rect.centerx - start_x) > me.stats["speed"]:
+                        bits = self._steer(me, start_x)  # get to the take-off spot first
+                    else:
+                        bits = INPUT_JUMP | (self._steer(me, target_x) if kind == JUMP else 0)
+        elif self.edge is not None:
+            self.airtime += 1
+            _, kind, frames, target_x = self.edge
+            if kind != JUMP_LATE or abs(target_x - me.rect.centerx) >= me.stats["speed"] * (frames - self.airtime):
+                bits = self._steer(me, target_x)
+
+        # wriggle free when the plan isn't moving us
+        pos = me.rect.topleft
+        if bits & (INPUT_LEFT | INPUT_RIGHT) and pos == self.last_pos:
+            self.still += 1
+            if self.still > STUCK_FRAMES:
+                bits = INPUT_JUMP | self.rng.choice((INPUT_LEFT, INPUT_RIGHT))
+                self.still = 0
+                self.replan_at = 0
+        else:
+            self.still = 0
+        self.last_pos = pos
+        return bits
+
+    @staticmethod
+    def _steer(me, x, slack=None):
+        # left or right towards x, nothing once within slack (half a frame's move by default)
+        if slack is None:
+            slack = me.stats["speed"] / 2
+        if x < me.rect.centerx - slack:
+            return INPUT_LEFT
+        if x > me.rect.centerx + slack:
+            return INPUT_RIGHT
+        return 0
+
+
+def bot_policy(rng, players=2, humans=()):
+    # like sim.random_policy: returns policy(state) -> INPUT_* bits for every player.
+    # Players listed in humans get 0; the caller fills in their keys.
+    bots = []
+
+    def policy(state):
+        graph = nav_graph(state)
+        if not bots:
+            bots.extend(None if i in humans else Bot(i, graph, rng) for i in range(players))
+        graph.update_portals(state.portals)
+        return [0 if bot is None else bot.keys(state) for bot in bots]
+    return policy
+
+
+# --- CLI ---
+def main():
+    parser = argparse.ArgumentParser(description="Play rounds with CPU players only and time them.")
+    parser.add_argument("--level", type=int, default=2)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--round-time", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for r in range(args.rounds):
+        state = GameState(args.level, seed=args.seed + r, round_time=args.round_time, players=args.players)
+        start = time.perf_counter()
+        policy = bot_policy(random.Random(args.seed + r), args.players)
+        policy(state)
+        graph = nav_graph(state)
+        built = (time.perf_counter() - start) * 1000
+        times = []
+        running = True
+        while running:
+            start = time.perf_counter()
+            inputs = policy(state)
+            times.append((time.perf_counter() - start) * 1000)
+            running = state.step(inputs)
+        edges = sum(map(len, graph.edges))
+        print(f"round {r}: {len(graph.nodes)} nodes, {edges} edges, graph {built:.1f} ms, {state.tags} tags, "
+              f"P{state.tagger + 1} is it | bots per frame p50 {statistics.median(times):.3f} ms "
+              f"p99 {statistics.quantiles(times, n=100)[98]:.3f} ms, {graph.field_builds} fields built")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+import math
+import random
+import sys
+from collections import OrderedDict
+
+import pygame
+
+WHITE = (255, 255, 255)
+EPSILON = 1e-6
+CHUNK_SIZE = 512  # masks are split along a grid of this many pixels
+MASK_CHUNK_CACHE = 64  # chunk masks kept built at once (least recently used go first)
+SWEPT_TOLERANCE = 0.02  # share of moves that may end off the mask result, see ConvexShape
+
+# sloped platforms for checking the swept shapes against masks (python collision.py)
+SLOPE_COURSE = [
+    [(100, 700), (500, 500), (500, 700)],
+    [(600, 700), (900, 700), (1000, 450), (700, 450)],
+    [(1100, 300), (1300, 200), (1350, 400)],
+    [(200, 200), (420, 130), (430, 160), (210, 231)],
+    [(0, 1300), (700, 1150), (1400, 1300), (1400, 1400), (0, 1400)],
+]
+
+
+# --- CONVEX POLYGON HELPERS ---
+def is_convex(verts):
+    # every turn along the outline must bend the same way (collinear points are fine)
+    n = len(verts)
+    if n < 3:
+        return False
+    sign = 0
+    for i in range(n):
+        x0, y0 = verts[i]
+        x1, y1 = verts[(i + 1) % n]
+        x2, y2 = verts[(i + 2) % n]
+        cross = (x1 - x0) * (y2 - y1) - (y1 - y0) * (x2 - x1)
+        if cross == 0:
+            continue
+        turn = 1 if cross > 0 else -1
+        if sign == 0:
+            sign = turn
+        elif turn != sign:
+            return False
+    return sign != 0
+
+
+def convex_hull(points):
+    # Andrew's monotone chain, returns the hull counter-clockwise without repeats
+    pts = sorted(set(points))
+    if len(pts) <= 2:
+        return pts
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+def pixel_hull(verts):
+    # pygame.draw.polygon fills the pixels on the outline too, so a polygon spanning
+    # x 0..1400 covers pixel columns 0..1400. Growing every vertex by one pixel to the
+    # right/bottom gives the continuous shape that matches what the mask path sees.
+    grown = []
+    for x, y in verts:
+        grown.extend(((x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)))
+    return convex_hull(grown)
+
+
+class ConvexShape:
+    # a static convex polygon tested against axis-aligned player rects with the
+    # separating axis theorem. The player is always a filled rect, so its own mask
+    # never has to be consulted.
+    #
+    # Tolerance: the shape is the hull of the vertices' pixels, which matches what
+    # pygame.draw.polygon fills exactly for axis-aligned edges. On a sloped edge it
+    # reaches up to a pixel past the filled pixels, so a move can stop short of
+    # where the mask path stops: by a pixel, or a few along a steep edge. That is
+    # not a rounding choice, time_of_impact already rounds toward the start like
+    # the mask path does. It only errs towards blocking, never lets a rect further
+    # than the mask path would, and stays under SWEPT_TOLERANCE of moves (about
+    # 1% on SLOPE_COURSE).
+    # `python collision.py` checks both.
+    def __init__(self, verts):
+        self.verts = list(verts)
+        self.points = pixel_hull(self.verts)
+        xs = [x for x, _ in self.points]
+        ys = [y for _, y in self.points]
+        self.bounds = pygame.Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+        # candidate axes: the rect's own two plus every edge normal of the polygon
+        normals = [(1.0, 0.0), (0.0, 1.0)]
+        n = len(self.points)
+        for i in range(n):
+            x0, y0 = self.points[i]
+            x1, y1 = self.points[(i + 1) % n]
+            nx, ny = y1 - y0, x0 - x1
+            length = math.hypot(nx, ny)
+            if length == 0:
+                continue
+            nx, ny = nx / length, ny / length
+            if nx < 0 or (nx == 0 and ny < 0):
+                nx, ny = -nx, -ny
+            if all(abs(nx - ax) > EPSILON or abs(ny - ay) > EPSILON for ax, ay in normals):
+                normals.append((nx, ny))
+
+        self.axes = []
+        for nx, ny in normals:
+            proj = [nx * x + ny * y for x, y in self.points]
+            self.axes.append((nx, ny, min(proj), max(proj)))
+
+    @staticmethod
+    def _project_rect(nx, ny, x, y, w, h):
+        base = nx * x + ny * y
+        lo = base + min(0.0, nx * w) + min(0.0, ny * h)
+        hi = base + max(0.0, nx * w) + max(0.0, ny * h)
+        return lo, hi
+
+    def overlaps(self, x, y, w, h):
+        # touching edges do not count, same as two masks that only share a border
+        for nx, ny, lo, hi in self.axes:
+            rlo, rhi = self._project_rect(nx, ny, x, y, w, h)
+            if rhi <= lo + EPSILON or rlo >= hi - EPSILON:
+                return False
+        return True
+
+    def time_of_impact(self, x, y, w, h, vx, vy):
+        # fraction of (vx, vy) the rect can travel before its interior enters the shape,
+        # or None if the move never overlaps it
+        t_enter = -math.inf
+        t_exit = math.inf
+        for nx, ny, lo, hi in self.axes:
+            rlo, rhi = self._project_rect(nx, ny, x, y, w, h)
+            vp = nx * vx + ny * vy
+            if abs(vp) < EPSILON:
+                if rhi <= lo + EPSILON or rlo >= hi - EPSILON:
+                    return None
+                continue
+            if vp > 0:
+                a, b = (lo - rhi) / vp, (hi - rlo) / vp
+            else:
+                a, b = (hi - rlo) / vp, (lo - rhi) / vp
+            t_enter = max(t_enter, a)
+            t_exit = min(t_exit, b)
+            if t_enter >= t_exit - EPSILON:
+                return None
+        if t_enter >= 1 or t_exit <= 0:
+            return None
+        return max(t_enter, 0.0)
+
+    def exit_distance(self, x, y, w, h, vx, vy):
+        # how far along the unit direction (vx, vy) an overlapping rect must move to get out
+        t_sep = math.inf
+        for nx, ny, lo, hi in self.axes:
+            rlo, rhi = self._project_rect(nx, ny, x, y, w, h)
+            vp = nx * vx + ny * vy
+            if abs(vp) < EPSILON:
+                continue
+            t_sep = min(t_sep, (hi - rlo) / vp if vp > 0 else (lo - rhi) / vp)
+        return max(t_sep, 0.0)
+
+
+# --- CROPPED MASKS ---
+def polygon_bounds(verts, width, height):
+    # pixels pygame.draw.polygon touches, clipped to the playfield like a full-screen mask
+    xs = [x for x, _ in verts]
+    ys = [y for _, y in verts]
+    left, top = max(0, int(min(xs))), max(0, int(min(ys)))
+    right, bottom = min(width, int(max(xs)) + 1), min(height, int(max(ys)) + 1)
+    return pygame.Rect(left, top, max(0, right - left), max(0, bottom - top))
+
+
+def merge_polygon_groups(polys, width, height):
+    # union polygons whose pixel bounds overlap or touch, so neighbouring platforms
+    # share one mask instead of each getting their own
+    bounds = [polygon_bounds(verts, width, height) for verts in polys]
+    parent = list(range(len(polys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(polys)):
+        grown = bounds[i].inflate(2, 2)
+        for j in range(i + 1, len(polys)):
+            if grown.colliderect(bounds[j]):
+                parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(len(polys)):
+        groups.setdefault(find(i), []).append(i)
+    return [([polys[i] for i in members], bounds[members[0]].unionall([bounds[i] for i in members]))
+            for members in groups.values()]
+
+
+def chunk_pieces(polys, width, height, chunk_size=CHUNK_SIZE):
+    # Merge polygons into groups as above, then cut each group along a chunk_size grid:
+    # [(polys, bounds, group)], one piece per chunk a group covers, with bounds clipped
+    # to that chunk and only the polygons that reach into it. Nothing is rasterized yet.
+    pieces = []
+    for group, (members, bounds) in enumerate(merge_polygon_groups(polys, width, height)):
+        if not bounds.width or not bounds.height:
+            continue
+        member_bounds = [polygon_bounds(verts, width, height) for verts in members]
+        for cx in range(bounds.left // chunk_size, (bounds.right - 1) // chunk_size + 1):
+            for cy in range(bounds.top // chunk_size, (bounds.bottom - 1) // chunk_size + 1):
+                clip = bounds.clip(pygame.Rect(cx * chunk_size, cy * chunk_size, chunk_size, chunk_size))
+                inside = [verts for verts, b in zip(members, member_bounds) if b.colliderect(clip)]
+                if inside:
+                    pieces.append((inside, clip, group))
+    return pieces
+
+
+def build_cropped_mask(polys, bounds):
+    # mask covering only `bounds`, with the polygons drawn relative to its corner
+    surf = pygame.Surface(bounds.size, pygame.SRCALPHA)
+    for verts in polys:
+        pygame.draw.polygon(surf, WHITE, [(x - bounds.x, y - bounds.y) for x, y in verts])
+    return pygame.mask.from_surface(surf)
+
+
+# --- SPATIAL INDEX ---
+class SpatialGrid:
+    # uniform grid of buckets; every item is filed under each cell its bounds cover
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.count = 0
+
+    def _cells(self, left, top, right, bottom):
+        cs = self.cell_size
+        for cx in range(left // cs, (right - 1) // cs + 1):
+            for cy in range(top // cs, (bottom - 1) // cs + 1):
+                yield cx, cy
+
+    def insert(self, item, bounds):
+        entry = (self.count, item)
+        self.count += 1
+        for cell in self._cells(bounds.left, bounds.top, max(bounds.right, bounds.left + 1),
+                                max(bounds.bottom, bounds.top + 1)):
+            self.cells.setdefault(cell, []).append(entry)
+
+    def query(self, left, top, right, bottom):
+        # items whose cells meet the box, in insertion order, each once
+        found = {}
+        cells = self.cells
+        for cell in self._cells(left, top, max(right, left + 1), max(bottom, top + 1)):
+            bucket = cells.get(cell)
+            if bucket:
+                for index, item in bucket:
+                    found[index] = item
+        if len(found) > 1:
+            return [found[i] for i in sorted(found)]
+        return list(found.values())
+
+
+def spawn_span(verts):
+    # (min_x, max_x, top_y, bottom_y) of a platform, used for buff and portal spawns
+    xs = [x for x, _ in verts]
+    ys = [y for _, y in verts]
+    return (min(xs), max(xs), min(ys), max(ys))
+
+
+def platform_spans(objects):
+    # platforms wide enough to spawn on (spawns keep 20px away from each edge)
+    return [span for span in map(spawn_span, objects) if span[1] - span[0] >= 40]
+
+
+# --- LEVEL COLLISION ---
+class LevelCollision:
+    # Convex polygons are swept analytically. Anything concave keeps a pixel mask and
+    # is stepped one pixel at a time like before. Touching polygons are merged into one
+    # group, and each group is cut into chunk-sized pieces whose masks are built the
+    # first time a query reaches them and dropped again when MASK_CHUNK_CACHE others
+    # were used since, so a level many screens wide only holds masks near the players.
+    # query() hands out (mask, bounds, group) entries, and the offset passed to
+    # overlap() is relative to bounds. Shapes and pieces are filed in a grid so a query
+    # only looks at what is near the player.
+    # mask_loader / spawn_spans can be passed in precomputed (levels.py caches them),
+    # which skips rasterizing: mask_loader(i) returns the mask of self.pieces[i].
+    def __init__(self, objects, width, height, swept=True, cell_size=128, mask_loader=None, spawn_spans=None,
+                 chunk_size=CHUNK_SIZE, max_chunks=MASK_CHUNK_CACHE):
+        self.shapes = []
+        concave = []
+        for verts in objects:
+            if swept and is_convex(verts):
+                self.shapes.append(ConvexShape(verts))
+            else:
+                concave.append(verts)
+        self.pieces = chunk_pieces(concave, width, height, chunk_size)
+        self.mask_loader = mask_loader
+        self.loaded = OrderedDict()  # piece index -> entry, least recently used first
+        self.max_chunks = max_chunks
+
+        # running totals for the profiler, see take_counters()
+        self.mask_overlaps = 0
+        self.shape_tests = 0
+        self.chunk_builds = 0
+
+        self.grid = SpatialGrid(cell_size)
+        for shape in self.shapes:
+            self.grid.insert(shape, shape.bounds)
+        for index, (_, bounds, _) in enumerate(self.pieces):
+            self.grid.insert(index, bounds)
+
+        self.spawn_spans = [tuple(span) for span in (spawn_spans or platform_spans(objects))]
+
+    def chunk(self, index):
+        # (mask, bounds, group) of one piece, built (or loaded) if it isn't already
+        entry = self.loaded.get(index)
+        if entry is not None:
+            self.loaded.move_to_end(index)
+            return entry
+        polys, bounds, group = self.pieces[index]
+        mask = self.mask_loader(index) if self.mask_loader is not None else build_cropped_mask(polys, bounds)
+        entry = self.loaded[index] = (mask, bounds, group)
+        self.chunk_builds += 1
+        if len(self.loaded) > self.max_chunks:
+            self.loaded.popitem(last=False)
+        return entry
+
+    def query(self, left, top, right, bottom):
+        # (shapes, mask entries) whose bounds might touch the box
+        shapes = []
+        masks = []
+        for item in self.grid.query(left, top, right, bottom):
+            if isinstance(item, ConvexShape):
+                shapes.append(item)
+            else:
+                masks.append(self.chunk(item))
+        return shapes, masks
+
+    def take_counters(self):
+        # mask.overlap calls, convex shape tests and chunk masks built since the last call
+        counters = {"mask.overlap": self.mask_overlaps, "shape tests": self.shape_tests,
+                    "chunk builds": self.chunk_builds}
+        self.mask_overlaps = 0
+        self.shape_tests = 0
+        self.chunk_builds = 0
+        return counters
+
+    def _mask_hit(self, masks, rect_mask, x, y):
+        w, h = rect_mask.get_size()
+        for mask, bounds, _ in masks:
+            if x + w <= bounds.left or x >= bounds.right or y + h <= bounds.top or y >= bounds.bottom:
+                continue
+            self.mask_overlaps += 1
+            if mask.overlap(rect_mask, (x - bounds.x, y - bounds.y)):
+                return True
+        return False
+
+    def overlaps(self, rect, rect_mask, x=None, y=None):
+        x = rect.x if x is None else x
+        y = rect.y if y is None else y
+        shapes, masks = self.query(x, y, x + rect.width, y + rect.height)
+        self.shape_tests += len(shapes)
+        for shape in shapes:
+            if shape.overlaps(x, y, rect.width, rect.height):
+                return True
+        return self._mask_hit(masks, rect_mask, x, y)
+
+    @staticmethod
+    def _mask_exit(mask, bounds, rect_mask, x, y, dx, dy):
+        # how far along the axis (dx, dy) the rect at (x, y) must move before it clears
+        # every bit it overlaps now. The player is a filled rect, so that only depends on
+        # the overlapping row (or column) furthest along the move: moving up, the rect
+        # is clear once its bottom edge has passed the topmost one.
+        w, h = rect_mask.get_size()
+        hit = rect_mask.overlap_mask(mask, (bounds.x - x, bounds.y - y)).get_bounding_rects()
+        if dy < 0:
+            return h - min(r.top for r in hit)
+        if dy > 0:
+            return max(r.bottom for r in hit)
+        if dx < 0:
+            return w - min(r.left for r in hit)
+        return max(r.right for r in hit)
+
+    def push_out(self, rect, rect_mask, dx, dy, limit, start=0, strict=False):
+        # smallest d in start..limit for which the rect moved d pixels along the unit axis
+        # (dx, dy) overlaps nothing, or None. Convex shapes and masks both say how far
+        # they reach along the axis, so this takes a query or two, not one per pixel.
+        # strict: give up if the move runs into anything the rect did not already overlap
+        # at d == start, so a player is never pushed into (or through) other geometry.
+        x, y, w, h = rect.x, rect.y, rect.width, rect.height
+        ex, ey = x + dx * limit, y + dy * limit
+        shapes, masks = self.query(min(x, ex), min(y, ey), max(x, ex) + w, max(y, ey) + h)
+        d = start
+        first = None
+        while d <= limit:
+            px, py = x + dx * d, y + dy * d
+            needed = d
+            hits = []
+            self.shape_tests += len(shapes)
+            for shape in shapes:
+                if shape.overlaps(px, py, w, h):
+                    hits.append(shape)
+                    out = shape.exit_distance(px, py, w, h, float(dx), float(dy))
+                    needed = max(needed, d + max(1, math.ceil(out - EPSILON)))
+            for mask, bounds, group in masks:
+                if px + w <= bounds.left or px >= bounds.right or py + h <= bounds.top or py >= bounds.bottom:
+                    continue
+                self.mask_overlaps += 1
+                if mask.overlap(rect_mask, (px - bounds.x, py - bounds.y)):
+                    hits.append(group)  # pieces of one group count as the same geometry
+                    needed = max(needed, d + self._mask_exit(mask, bounds, rect_mask, px, py, dx, dy))
+            if not hits:
+                return d
+            if strict:
+                if first is None:
+                    first = hits
+                elif any(hit not in first for hit in hits):
+                    return None
+            d = needed
+        return None
+
+    def step_up(self, rect, rect_mask, step_height):
+        # smallest upward lift (1..step_height) that clears the level, or None
+        return self.push_out(rect, rect_mask, 0, -1, step_height, start=1)
+
+    def unstick(self, rect, rect_mask, up=-1):
+        # Minimum translation out of the level for a rect that overlaps it: the shortest
+        # push along the four axes that clears everything it overlaps without entering
+        # anything else, or None. Each push is capped at the rect's own size on that axis,
+        # which is the most it takes to leave an overlap through the near side; anything
+        # longer would mean going through the geometry. Ties go to `up` (away from
+        # gravity, -1 or 1) first and towards gravity last. Returns (dx, dy).
+        best = None
+        for dx, dy in ((0, up), (-1, 0), (1, 0), (0, -up)):
+            limit = rect.height if dy else rect.width
+            d = self.push_out(rect, rect_mask, dx, dy, limit, strict=True)
+            if d is not None and (best is None or d < best[0]):
+                best = (d, dx * d, dy * d)
+        return None if best is None else best[1:]
+
+    def sweep_y(self, rect, rect_mask, dist):
+        # move up to |dist| whole pixels vertically, returns (pixels moved, blocked)
+        sign = 1 if dist > 0 else -1
+        limit = abs(dist)
+        blocked = False
+        x, y, w, h = rect.x, rect.y, rect.width, rect.height
+        shapes, masks = self.query(x, min(y, y + dist), x + w, max(y, y + dist) + h)
+        self.shape_tests += len(shapes)
+        for shape in shapes:
+            t = shape.time_of_impact(x, y, w, h, 0.0, float(dist))
+            if t is None:
+                continue
+            allowed = int(math.floor(t * abs(dist) + EPSILON))
+            if allowed < limit:
+                limit = allowed
+                blocked = True
+        if masks:
+            for i in range(1, limit + 1):
+                if self._mask_hit(masks, rect_mask, x, y + sign * i):
+                    limit = i - 1
+                    blocked = True
+                    break
+        return limit, blocked
+
+
+def resolve_collision(rect, rect_mask, level, dx, dy, gravity, max_fall, max_jump=None, step_height=10):
+    on_ground = False
+    on_ceiling = False  # for upward collision
+
+    # --- HORIZONTAL MOVE ---
+    if dx != 0:
+        rect.x += dx
+        if level.overlaps(rect, rect_mask):
+            lift = level.step_up(rect, rect_mask, step_height)
+            if lift is None:
+                rect.x -= dx
+            else:
+                rect.y -= lift
+
+    # --- VERTICAL MOVE (swept) ---
+    dy += gravity
+
+    # cap downward (fall) velocity
+    if dy > max_fall:
+        dy = max_fall
+
+    # cap upward (jump) velocity with a separate limit if provided
+    if max_jump is None:
+        # default behavior: symmetric cap (old behavior)
+        if dy < -max_fall:
+            dy = -max_fall
+    else:
+        if dy < -abs(max_jump):
+            dy = -abs(max_jump)
+
+    step = int(abs(dy))
+    if step == 0:
+        step = 1
+    step_sign = 1 if dy > 0 else -1
+
+    moved, blocked = level.sweep_y(rect, rect_mask, step * step_sign)
+    rect.y += moved * step_sign
+    if blocked:
+        dy = 0
+        if step_sign > 0:
+            on_ground = True   # landing on floor
+        else:
+            on_ceiling = True  # hitting ceiling
+
+    return rect, dy, on_ground, on_ceiling
+
+
+# --- SWEPT VS MASK CHECK ---
+def compare_swept(objects, width, height, size, moves=20000, seed=0):
+    # random rects moved vertically through both kinds of LevelCollision: returns
+    # {"moves", "off" (ended elsewhere), "further" (swept got past the mask result)}
+    rng = random.Random(seed)
+    swept = LevelCollision(objects, width, height, swept=True)
+    masked = LevelCollision(objects, width, height, swept=False)
+    w, h = size
+    rect_mask = pygame.Mask(size, fill=True)
+    result = {"moves": 0, "off": 0, "further": 0}
+    while result["moves"] < moves:
+        rect = pygame.Rect(rng.randint(0, width - w), rng.randint(0, height - h), w, h)
+        hit = swept.overlaps(rect, rect_mask)
+        if masked.overlaps(rect, rect_mask) and not hit:
+            result["further"] += 1  # the swept shape misses pixels the mask has
+        if hit:
+            continue
+        dist = rng.choice((-1, 1)) * rng.randint(1, 20)
+        moved, _ = swept.sweep_y(rect, rect_mask, dist)
+        expected, _ = masked.sweep_y(rect, rect_mask, dist)
+        result["moves"] += 1
+        result["off"] += moved != expected
+        result["further"] += moved > expected
+    return result
+
+
+def main():
+    from levels import load_levels
+    from sim import HEIGHT, WIDTH
+    courses = [(config.get("name", config["path"]), config) for config in load_levels()]
+    courses.append(("slopes", {"objects": SLOPE_COURSE, "playerSize": [40, 40]}))
+    ok = True
+    for name, config in courses:
+        size = config["playerSize"]
+        result = compare_swept(config["objects"], config.get("width", WIDTH), config.get("height", HEIGHT),
+                               (size, size) if isinstance(size, int) else tuple(size))
+        share = result["off"] / result["moves"]
+        passed = not result["further"] and share <= SWEPT_TOLERANCE
+        ok &= passed
+        print(f"{name:<12} {result['moves']} moves, {share:.2%} off the mask result, "
+              f"{result['further']} further: {'ok' if passed else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
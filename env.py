@@ -0,0 +1,268 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import PLAYERS, BUFF_TYPES, BUFF_SLOTS, BatchSim
+from sim import FPS, ROUND_TIME, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, GameState
+
+# Reinforcement learning environments for tag, with the Gymnasium API
+# (reset() -> obs, info and step() -> obs, reward, terminated, truncated, info)
+# but without depending on gymnasium. Every player is an agent: actions come in one
+# per player and rewards go out one per player, so the same env does self-play.
+#
+#   TagEnv        one round on a GameState, the exact rules tag.py plays by
+#   TagVectorEnv  many rounds on a BatchSim (two players, rectangular platforms),
+#                 stepped together; obs, rewards and flags are numpy arrays made once
+#                 and filled in place every step, and finished rounds restart on
+#                 their own
+#
+# Observations are float32 rows of OBS_SIZE, one per player and seen from that
+# player: its own block first, then the other players' in turn order, then what is
+# shared. Positions are divided by the world size, sizes by playerSize, x velocity
+# by playerSpeed and y velocity by playerMaxFall.
+#   per player  x, y, w, h, vel_x, vel_y, it, shield, frozen, standing
+#   per buff    on ground, x, y, one-hot type (BUFF_SLOTS of these, empty ones zero)
+#   portals     active, x1, y1, x2, y2
+#   time        share of the round left
+#
+# Rewards: whoever is "it" loses IT_PENALTY spread over the round, and at the end
+# the winners get +WIN_REWARD and the tagger -WIN_REWARD. Runs without a display.
+#
+#   python env.py --envs 1024                   env-steps/s of the vector env
+#   python env.py --envs 1024 --workers 8       the same on 8 processes
+#   python env.py --exact --envs 16             TagEnv instead (one GameState per env)
+
+# the keys a player can hold, as in tag.py: A / LEFT, D / RIGHT, W / UP
+ACTIONS = np.array([0, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_LEFT | INPUT_JUMP, INPUT_RIGHT | INPUT_JUMP],
+                   np.int64)
+PLAYER_FEATURES = 10
+BUFF_FEATURES = 3 + len(BUFF_TYPES)
+SHARED_FEATURES = BUFF_SLOTS * BUFF_FEATURES + 5 + 1
+WIN_REWARD = 1.0
+IT_PENALTY = 1.0
+
+
+def obs_size(players=PLAYERS):
+    return players * PLAYER_FEATURES + SHARED_FEATURES
+
+
+OBS_SIZE = obs_size()
+
+
+# --- SINGLE ROUND ---
+class TagEnv:
+    def __init__(self, level=0, players=PLAYERS, round_time=ROUND_TIME, config=None):
+        self.level = level
+        self.players = players
+        self.round_time = round_time
+        self.config = config
+        self.action_count = len(ACTIONS)
+        self.observation_shape = (players, obs_size(players))
+        self.obs = np.zeros(self.observation_shape, np.float32)
+        self.reward = np.zeros(players, np.float32)
+        self.prev_x = [0] * players
+        self.state = None
+
+    def reset(self, seed=None):
+        self.state = GameState(self.level, seed=seed, round_time=self.round_time, config=self.config,
+                               players=self.players)
+        self.prev_x = [p.rect.x for p in self.state.players]
+        return self._observe(), {}
+
+    def step(self, actions):
+        state = self.state
+        for i, p in enumerate(state.players):
+            self.prev_x[i] = p.rect.x
+        state.step([ACTIONS[a] for a in actions])
+        self.reward.fill(0)
+        self.reward[state.tagger] = -IT_PENALTY / state.round_frames
+        if state.over:
+            self.reward += WIN_REWARD
+            self.reward[state.tagger] -= 2 * WIN_REWARD
+        return self._observe(), self.reward, state.over, False, {"tags": state.tags}
+
+    def _observe(self):
+        state, obs = self.state, self.obs
+        config = state.config
+        players = state.players
+        n = len(players)
+        own = np.zeros((n, PLAYER_FEATURES), np.float32)
+        for i, p in enumerate(players):
+            r = p.rect
+            own[i] = (r.x / state.width, r.y / state.height, r.width / p.base_size, r.height / p.base_size,
+                      (r.x - self.prev_x[i]) / config["playerSpeed"], p.vel_y / p.max_fall,
+                      i == state.tagger, p.stats.get("shield", False), p.stats.get("frozen", False),
+                      p.on_ground or p.on_ceiling)
+        shared = obs[0, n * PLAYER_FEATURES:]
+        shared.fill(0)
+        for s, buff in enumerate(list(state.buffs.on_ground.values())[:BUFF_SLOTS]):
+            row = shared[s * BUFF_FEATURES:(s + 1) * BUFF_FEATURES]
+            row[:3] = (1, buff.pos[0] / state.width, buff.pos[1] / state.height)
+            row[3 + BUFF_TYPES.index(buff.type_name)] = 1
+        portals = state.portals
+        (x1, y1), (x2, y2) = portals["positions"]
+        shared[-6:] = (portals["active"], x1 / state.width, y1 / state.height, x2 / state.width, y2 / state.height,
+                       1 - state.frame / state.round_frames)
+        for i in range(n):
+            for k in range(n):
+                obs[i, k * PLAYER_FEATURES:(k + 1) * PLAYER_FEATURES] = own[(i + k) % n]
+            obs[i, n * PLAYER_FEATURES:] = shared
+        return obs
+
+
+# --- MANY ROUNDS ---
+class TagVectorEnv:
+    # step() and reset() hand back the same arrays every time, so copy anything that
+    # has to outlive the next call. info["final_obs"] holds the last observation of
+    # the rounds that just ended (their rows in obs already show the new round).
+    def __init__(self, n, level=0, round_time=ROUND_TIME, config=None, seed=None):
+        self.num_envs = n
+        self.sim = BatchSim(n, level=level, seed=seed, round_time=round_time, config=config)
+        self.action_count = len(ACTIONS)
+        self.observation_shape = (n, PLAYERS, OBS_SIZE)
+        self.obs = np.zeros(self.observation_shape, np.float32)
+        self.final_obs = np.zeros(self.observation_shape, np.float32)
+        self.reward = np.zeros((n, PLAYERS), np.float32)
+        self.terminated = np.zeros(n, bool)
+        self.truncated = np.zeros(n, bool)
+        self.tags = np.zeros(n, np.int64)
+        self.info = {"final_obs": self.final_obs, "tags": self.tags}
+
+        sim = self.sim
+        self._inputs = np.zeros((n, PLAYERS), np.int64)
+        self._prev_x = np.zeros((n, PLAYERS), np.int64)
+        self._own = np.zeros((n, PLAYERS, PLAYER_FEATURES), np.float32)
+        self._shared = np.zeros((n, SHARED_FEATURES), np.float32)
+        self._buffs = self._shared[:, :BUFF_SLOTS * BUFF_FEATURES].reshape(n, BUFF_SLOTS, BUFF_FEATURES)
+        self._onehot = np.zeros((n, BUFF_SLOTS, len(BUFF_TYPES)), bool)
+        self._type_ids = np.arange(len(BUFF_TYPES))
+        self._it = np.zeros((n, PLAYERS), bool)
+        self._standing = np.zeros((n, PLAYERS), bool)
+        self._players = np.arange(PLAYERS)
+        self._scale = {"x": 1 / sim.width, "y": 1 / sim.height, "size": 1 / sim.base_size,
+                       "vx": 1 / sim.base_speed, "vy": 1 / sim.max_fall, "time": 1 / sim.round_frames}
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.sim.rng = np.random.default_rng(seed)
+        self.sim.reset()
+        np.copyto(self._prev_x, self.sim.x)
+        self.final_obs.fill(0)
+        self.tags.fill(0)
+        return self._observe(), self.info
+
+    def step(self, actions):
+        # actions: (n, PLAYERS) indices into ACTIONS
+        sim = self.sim
+        np.take(ACTIONS, actions, out=self._inputs)
+        np.copyto(self._prev_x, sim.x)
+        sim.step(self._inputs)
+        done = self.terminated
+        np.copyto(done, sim.done)
+
+        # the tagger pays every frame, the round's end settles who won
+        np.equal(sim.tagger[:, None], self._players, out=self._it)
+        np.multiply(self._it, -IT_PENALTY * self._scale["time"], out=self.reward)
+        if done.any():
+            self.reward[done] += WIN_REWARD
+            self.reward[self._it & done[:, None]] -= 2 * WIN_REWARD
+            np.copyto(self.tags, sim.tags, where=done)
+            self._observe()
+            np.copyto(self.final_obs, self.obs, where=done[:, None, None])
+            sim.reset(done)
+            np.copyto(self._prev_x, sim.x, where=done[:, None])
+        return self._observe(), self.reward, self.terminated, self.truncated, self.info
+
+    def _observe(self):
+        sim, obs, own, s = self.sim, self.obs, self._own, self._scale
+        np.multiply(sim.x, s["x"], out=own[..., 0], casting="unsafe")
+        np.multiply(sim.y, s["y"], out=own[..., 1], casting="unsafe")
+        np.multiply(sim.w, s["size"], out=own[..., 2], casting="unsafe")
+        np.multiply(sim.h, s["size"], out=own[..., 3], casting="unsafe")
+        np.subtract(sim.x, self._prev_x, out=own[..., 4], casting="unsafe")
+        own[..., 4] *= s["vx"]
+        np.multiply(sim.vel_y, s["vy"], out=own[..., 5], casting="unsafe")
+        np.equal(sim.tagger[:, None], self._players, out=self._it)
+        own[..., 6] = self._it
+        own[..., 7] = sim.shield
+        own[..., 8] = sim.frozen
+        np.logical_or(sim.on_ground, sim.on_ceiling, out=self._standing)
+        own[..., 9] = self._standing
+
+        buffs = self._buffs
+        buffs[..., 0] = sim.buff_alive
+        np.multiply(sim.buff_x, s["x"], out=buffs[..., 1], casting="unsafe")
+        np.multiply(sim.buff_y, s["y"], out=buffs[..., 2], casting="unsafe")
+        np.equal(sim.buff_type[..., None], self._type_ids, out=self._onehot)
+        self._onehot &= sim.buff_alive[..., None]
+        buffs[..., 3:] = self._onehot
+        buffs[..., 1:3] *= buffs[..., :1]  # empty slots read as all zeros
+
+        tail = self._shared[:, BUFF_SLOTS * BUFF_FEATURES:]
+        tail[:, 0] = sim.portal_active
+        np.multiply(sim.portal_pos[:, 0, 0], s["x"], out=tail[:, 1], casting="unsafe")
+        np.multiply(sim.portal_pos[:, 0, 1], s["y"], out=tail[:, 2], casting="unsafe")
+        np.multiply(sim.portal_pos[:, 1, 0], s["x"], out=tail[:, 3], casting="unsafe")
+        np.multiply(sim.portal_pos[:, 1, 1], s["y"], out=tail[:, 4], casting="unsafe")
+        np.multiply(sim.frame, -s["time"], out=tail[:, 5], casting="unsafe")
+        tail[:, 5] += 1
+
+        for p in range(PLAYERS):
+            for k in range(PLAYERS):
+                obs[:, p, k * PLAYER_FEATURES:(k + 1) * PLAYER_FEATURES] = own[:, (p + k) % PLAYERS]
+            obs[:, p, PLAYERS * PLAYER_FEATURES:] = self._shared
+        return obs
+
+
+# --- THROUGHPUT ---
+def _run(job):
+    # env-steps/s of one process: random actions, drawn before the clock starts
+    exact, envs, level, steps, seed = job
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, len(ACTIONS), (64, envs, PLAYERS))
+    if exact:
+        runs = [TagEnv(level) for _ in range(envs)]
+        for i, env in enumerate(runs):
+            env.reset(seed + i)
+        start = time.perf_counter()
+        for t in range(steps):
+            for i, env in enumerate(runs):
+                if env.step(actions[t % 64, i])[2]:
+                    env.reset()
+    else:
+        env = TagVectorEnv(envs, level, seed=seed)
+        env.reset()
+        start = time.perf_counter()
+        for t in range(steps):
+            env.step(actions[t % 64])
+    return envs * steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure env-steps per second of the training environments.")
+    parser.add_argument("--level", type=int, default=0)
+    parser.add_argument("--envs", type=int, default=1024, help="rounds stepped together per process")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--exact", action="store_true", help="one TagEnv (GameState) per env instead")
+    args = parser.parse_args()
+
+    jobs = [(args.exact, args.envs, args.level, args.steps, args.seed + w * args.envs) for w in range(args.workers)]
+    if args.workers == 1:
+        rates = [_run(jobs[0])]
+    else:
+        with ProcessPoolExecutor(args.workers) as pool:
+            rates = list(pool.map(_run, jobs))
+    kind = "TagEnv" if args.exact else "TagVectorEnv"
+    total = sum(rates)
+    print(f"{kind} level {args.level}: {args.workers} x {args.envs} envs, {args.steps} steps each")
+    print(f"{total:.0f} env-steps/s, {total / args.workers:.0f} per core "
+          f"({total / args.workers / (FPS * ROUND_TIME):.1f} rounds/s per core, {os.cpu_count()} cores here)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import math
+from collections import OrderedDict
+
+import pygame
+
+from render import WHITE, player_colors
+from sim import FPS
+
+# The HUD is drawn over the world in screen space: the round clock, and with
+# scoreboard on one row per player (time spent as "it", tags made, the buffs it
+# holds with their seconds left).
+#
+# Nothing is rendered with the font per frame. GlyphCache renders each character
+# once and puts strings together from those glyphs. Each element is an opaque
+# panel of a fixed size that is only repainted when the values it shows change
+# (about once a second). Every frame a panel is only blitted again if it changed,
+# if the whole screen was redrawn, or if the world drew over or erased part of it.
+
+PANEL_COLOR = (40, 40, 40)
+MARGIN = 10
+PADDING = 6
+STRIP_CACHE = 128  # strings kept put together (least recently used go first)
+MAX_BUFF_ICONS = 4  # held buffs shown per scoreboard row
+
+
+class GlyphCache:
+    def __init__(self, font, color=WHITE):
+        self.font = font
+        self.color = color
+        self.height = font.get_linesize()
+        self.glyphs = {}
+        self.strips = OrderedDict()  # text -> Surface, least recently used first
+
+    def glyph(self, ch):
+        glyph = self.glyphs.get(ch)
+        if glyph is None:
+            glyph = self.glyphs[ch] = self.font.render(ch, True, self.color)
+        return glyph
+
+    def width(self, text):
+        return sum(self.glyph(ch).get_width() for ch in text)
+
+    def widest(self, text):
+        # width of text with every digit as the widest digit: room for any number
+        # with that many digits, so a panel sized by it never clips a ticking value
+        digit = max("0123456789", key=lambda ch: self.glyph(ch).get_width())
+        return self.width("".join(digit if ch.isdigit() else ch for ch in text))
+
+    def strip(self, text):
+        strip = self.strips.get(text)
+        if strip is not None:
+            self.strips.move_to_end(text)
+            return strip
+        strip = self.strips[text] = pygame.Surface((max(1, self.width(text)), self.height), pygame.SRCALPHA)
+        x = 0
+        for ch in text:
+            glyph = self.glyph(ch)
+            strip.blit(glyph, (x, 0))
+            x += glyph.get_width()
+        if len(self.strips) > STRIP_CACHE:
+            self.strips.popitem(last=False)
+        return strip
+
+
+class Panel:
+    # one HUD element: a fixed-size surface, where it goes and the value it shows
+    def __init__(self, size):
+        self.surface = pygame.Surface(size)
+        self.rect = pygame.Rect((0, 0), size)
+        self.value = None
+
+
+def clock_text(frames):
+    seconds = math.ceil(frames / FPS)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class Hud:
+    def __init__(self, font, small_font=None, buff_images=None, scoreboard=True):
+        self.big = GlyphCache(font)
+        self.small = GlyphCache(small_font or font)
+        self.scoreboard = scoreboard
+        row = self.small.height
+        # buff icons shrunk to the row height once, not per draw
+        self.icons = {name: pygame.transform.scale(img, (row, row)) for name, img in (buff_images or {}).items()}
+        self.clock = self._clock_panel("0:00")
+        widest = self.small.widest("P16 IT 0:00 00 tags") + row + PADDING
+        self.row_size = (widest + MAX_BUFF_ICONS * (row + self.small.widest("00 ")) + 2 * PADDING, row + PADDING)
+        self.rows = []
+
+    def _clock_panel(self, text):
+        return Panel((self.big.widest(text) + 2 * PADDING, self.big.height + 2 * PADDING))
+
+    def _paint_clock(self, panel):
+        surf = panel.surface
+        surf.fill(PANEL_COLOR)
+        strip = self.big.strip(panel.value)
+        surf.blit(strip, strip.get_rect(center=surf.get_rect().center))
+
+    def _paint_row(self, panel, index):
+        # returns the width the row needed, which can be more than the panel has
+        it, it_seconds, tags, held = panel.value
+        surf = panel.surface
+        small = self.small
+        row = small.height
+        surf.fill(PANEL_COLOR)
+        x, y = PADDING, PADDING // 2
+        swatch = pygame.Rect(x, y + 2, row - 4, row - 4)
+        surf.fill(player_colors[index % len(player_colors)], swatch)
+        if it:
+            pygame.draw.rect(surf, WHITE, swatch, 2)
+        x += row
+        for text in (f"P{index + 1}", "IT" if it else "", f"{it_seconds // 60}:{it_seconds % 60:02d}",
+                     f"{tags} tags"):
+            if text:
+                surf.blit(small.strip(text), (x, y))
+            x += small.width(text or "IT") + small.width(" ")
+        for name, seconds in held[:MAX_BUFF_ICONS]:
+            icon = self.icons.get(name)
+            if icon is not None:
+                surf.blit(icon, (x, y))
+            else:
+                pygame.draw.circle(surf, WHITE, (x + row // 2, y + row // 2), row // 2 - 2, 2)
+            x += row
+            surf.blit(small.strip(str(seconds)), (x, y))
+            x += small.widest("00 ")
+        return x + PADDING
+
+    def draw(self, surface, state, touched, full=False):
+        # touched: rects the world erased or drew on this frame. Returns the rects
+        # repainted, which are not erased again next frame (the panels are opaque).
+        drawn = []
+        width = surface.get_width()
+
+        # the clock counts down the time left
+        panel = self.clock
+        panel.rect.midtop = (width // 2, MARGIN)
+        value = clock_text(max(0, state.round_frames - state.frame))
+        changed = value != panel.value
+        if changed and self.big.widest(value) + 2 * PADDING > panel.rect.width:
+            # e.g. "10:00" in a round of ten minutes or more: make room for the longest
+            # clock the round shows, not just this one
+            panel = self.clock = self._clock_panel(clock_text(max(state.round_frames, state.frame)))
+            panel.rect.midtop = (width // 2, MARGIN)
+        if changed:
+            panel.value = value
+            self._paint_clock(panel)
+        if changed or full or panel.rect.collidelist(touched) != -1:
+            drawn.append(surface.blit(panel.surface, panel.rect))
+
+        if not self.scoreboard:
+            return drawn
+        while len(self.rows) < len(state.players):
+            self.rows.append(Panel(self.row_size))
+        held = [[] for _ in state.players]
+        for buff in state.buffs.applied.values():
+            if buff.applied_to is not None:
+                held[buff.applied_to].append((buff.type_name, math.ceil(buff.timer / FPS)))
+        y = MARGIN
+        for player, panel in zip(state.players, self.rows):
+            panel.rect.topright = (width - MARGIN, y)
+            y += panel.rect.height + 2
+            value = (player.index == state.tagger, player.it_frames // FPS, player.tags, held[player.index])
+            changed = value != panel.value
+            if changed:
+                panel.value = value
+                needed = self._paint_row(panel, player.index)
+                if needed > panel.rect.width:
+                    # more it-time or tags than the rows were sized for: widen them all
+                    self.row_size = (needed, self.row_size[1])
+                    self.rows = [Panel(self.row_size) for _ in self.rows]
+                    return self.draw(surface, state, touched, full=True)
+            if changed or full or panel.rect.collidelist(touched) != -1:
+                drawn.append(surface.blit(panel.surface, panel.rect))
+        return drawn
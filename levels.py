@@ -0,0 +1,167 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import tomllib
+
+import pygame
+
+from collision import CHUNK_SIZE, LevelCollision
+
+# Levels are files in LEVEL_DIR, loaded in file name order (so "00-snow.json" is
+# level 0). JSON and TOML both work and hold the same keys:
+#   name, thumbnail          shown on the level select (thumbnail is an image path
+#                            relative to the game directory, like the other sprites)
+#   gravity, playerJump, playerSize, playerSpeed, playerMaxFall
+#   width, height            optional size of the world, by default one window
+#   objects                  polygons, each a list of [x, y] vertices
+#   spawn_zones              optional [min_x, max_x, top_y, bottom_y] spans for buffs
+#                            and portals, by default every platform at least 40px wide
+#
+# Rasterizing concave polygons into masks is the slow part of starting a round, so
+# the mask of every chunk piece (see LevelCollision) and the spawn spans are compiled
+# into a cache file next to the level, named after it. The game maps the file and
+# makes each chunk's mask from it the first time that chunk is needed. The cache
+# holds a hash of the level file and the settings it was built with, and is rebuilt
+# whenever that no longer matches.
+#
+# Cache layout (little endian):
+#   header   magic "TAGC", version, width, height, hash (16 bytes), spans, pieces
+#   spans    min_x, max_x, top_y, bottom_y per spawn span
+#   pieces   x, y, width, height per piece, then each piece's bitmap, one byte per pixel
+#
+#   python levels.py     compile every level (also happens on first use)
+
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+LEVEL_EXTENSIONS = (".json", ".toml")
+CACHE_MAGIC = b"TAGC"
+CACHE_VERSION = 2
+CACHE_HEADER = struct.Struct("<4sHII16sII")
+CACHE_SPAN = struct.Struct("<iiii")
+CACHE_MASK = struct.Struct("<iiII")
+
+
+# --- LOADING ---
+def load_level(path):
+    # level config dict as GameState takes it, plus where it came from
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".toml"):
+        config = tomllib.loads(data.decode())
+    else:
+        config = json.loads(data)
+    config["objects"] = [[tuple(v) for v in verts] for verts in config["objects"]]
+    if "spawn_zones" in config:
+        config["spawn_zones"] = [tuple(span) for span in config["spawn_zones"]]
+    config.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    config["path"] = path
+    config["hash"] = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return config
+
+
+def load_levels(directory=LEVEL_DIR):
+    paths = sorted(p for p in glob.glob(os.path.join(directory, "*")) if p.endswith(LEVEL_EXTENSIONS))
+    return [load_level(path) for path in paths]
+
+
+# --- COLLISION CACHE ---
+def cache_path(path, swept=True):
+    return os.path.splitext(path)[0] + (".collision" if swept else ".mask.collision")
+
+
+def cache_hash(config, width, height, swept):
+    settings = f"{config['hash']}:{CACHE_VERSION}:{width}x{height}:{swept}:{CHUNK_SIZE}"
+    return hashlib.blake2b(settings.encode(), digest_size=16).digest()
+
+
+def write_cache(path, config, width, height, swept, collision):
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, width, height, cache_hash(config, width, height, swept),
+                               len(collision.spawn_spans), len(collision.pieces))
+    parts = [header]
+    parts += [CACHE_SPAN.pack(*span) for span in collision.spawn_spans]
+    parts += [CACHE_MASK.pack(bounds.x, bounds.y, bounds.width, bounds.height) for _, bounds, _ in collision.pieces]
+    for index in range(len(collision.pieces)):
+        mask = collision.chunk(index)[0]
+        bitmap = mask.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 0))
+        parts.append(pygame.image.tobytes(bitmap, "RGBA")[3::4])  # just the alpha bytes
+    # write next to it and rename, so a reader never sees half a file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp, path)
+
+
+def read_cache(path, expected_hash):
+    # (mask_loader, spans) from a cache file, or None if it is missing or out of date.
+    # The file stays mapped for as long as the loader is around.
+    try:
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # ValueError: empty file
+        return None
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, version, _, _, digest, n_spans, n_pieces = CACHE_HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION or digest != expected_hash:
+        return None
+    pos = CACHE_HEADER.size
+    spans = [CACHE_SPAN.unpack_from(data, pos + i * CACHE_SPAN.size) for i in range(n_spans)]
+    pos += n_spans * CACHE_SPAN.size
+    sizes = [CACHE_MASK.unpack_from(data, pos + i * CACHE_MASK.size)[2:] for i in range(n_pieces)]
+    offsets = []
+    offset = pos + n_pieces * CACHE_MASK.size
+    for w, h in sizes:
+        offsets.append(offset)
+        offset += w * h
+    view = memoryview(data)
+
+    def load(index):
+        # the bitmap is used in place as an 8-bit surface, anything non-zero is solid
+        w, h = sizes[index]
+        bitmap = pygame.image.frombuffer(view[offsets[index]:offsets[index] + w * h], (w, h), "P")
+        bitmap.set_colorkey(0)
+        return pygame.mask.from_surface(bitmap)
+    return load, spans
+
+
+def compile_level(config, width, height, swept=True):
+    # rasterize every chunk of a level and write its cache; returns its LevelCollision
+    collision = LevelCollision(config["objects"], width, height, swept=swept, spawn_spans=config.get("spawn_zones"))
+    try:
+        write_cache(cache_path(config["path"], swept), config, width, height, swept, collision)
+    except OSError as e:
+        print(f"[!] Could not write the collision cache for {config['path']}: {e}")
+    return collision
+
+
+def load_collision(config, width, height, swept=True):
+    # LevelCollision for a level config, from the compiled cache when the config
+    # came from a level file (configs built in code are rasterized as needed)
+    if "path" not in config:
+        return LevelCollision(config["objects"], width, height, swept=swept, spawn_spans=config.get("spawn_zones"))
+    cached = read_cache(cache_path(config["path"], swept), cache_hash(config, width, height, swept))
+    if cached is None:
+        return compile_level(config, width, height, swept)
+    mask_loader, spans = cached
+    return LevelCollision(config["objects"], width, height, swept=swept, mask_loader=mask_loader, spawn_spans=spans)
+
+
+def main():
+    from sim import WIDTH, HEIGHT
+    directory = sys.argv[1] if len(sys.argv) > 1 else LEVEL_DIR
+    for config in load_levels(directory):
+        width, height = config.get("width", WIDTH), config.get("height", HEIGHT)
+        for swept in (True, False):
+            start = time.perf_counter()
+            collision = compile_level(config, width, height, swept)
+            print(f"{cache_path(config['path'], swept)}: {len(collision.pieces)} chunk masks, "
+                  f"{len(collision.spawn_spans)} spawn spans "
+                  f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
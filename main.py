@@ -0,0 +1,8 @@
+import asyncio
+
+from tag import main
+
+# Entry point for the web build: pygbag packages this folder and runs main.py.
+#   pygbag .        then open http://localhost:8000
+
+asyncio.run(main())
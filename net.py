@@ -0,0 +1,525 @@
+import argparse
+import asyncio
+import collections
+import random
+import struct
+import time
+
+import pygame
+
+from profiler import FrameProfiler
+from sim import (WIDTH, HEIGHT, FPS, ROUND_TIME, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, GameState, buff_defs,
+                 player_mask, random_policy)
+
+# Networked tag over UDP (asyncio, standard library only). The server runs the
+# GameState at a fixed FPS tick and is the only one that decides anything. Clients
+# send nothing but their key bits and get snapshots back; they move their own player
+# right away with the same _move_player the server uses (prediction) and, when a
+# snapshot arrives, take the server's word for everything and replay the inputs the
+# server has not seen yet on top of it (reconciliation).
+#
+# Snapshots are a set of records (globals, one per player, one per buff on the
+# ground, portals), each packed to bytes. A client acks the last snapshot it got and
+# the server only sends records that differ from that one, plus removals.
+#
+#   python net.py serve --players 4 --level 2         run a server on 0.0.0.0:7777
+#   python net.py join --host 192.168.1.5             play in a window
+#   python net.py test --clients 4 --seconds 10       server + headless clients on localhost
+
+PORT = 7777
+SNAPSHOT_HISTORY = 64        # ticks the server remembers to delta against
+INPUT_REDUNDANCY = 4         # every input packet repeats this many of the latest key states
+MAX_INPUT_BACKLOG = 4        # the server skips ahead when a client gets further ahead than this
+NO_FRAME = 0xFFFFFFFF
+
+# --- WIRE FORMAT ---
+JOIN = b"J"
+WELCOME = struct.Struct("<cBBBQI")      # type, your index, level, players, seed, round_time
+FULL = b"F"
+INPUT = struct.Struct("<cIIB")          # type, acked snapshot frame, newest seq, count (+ count key bytes)
+SNAPSHOT = struct.Struct("<cIII")       # type, frame, baseline frame, last input seq used (+ records)
+LEAVE = b"L"
+
+# positions are int32: level files can be wider or taller than an int16 reaches
+GLOBALS = struct.Struct("<cBI??")       # 'g', tagger, tags, tagging, over (frame is in the header)
+PLAYER = struct.Struct("<cBiiBBd??ddBf")  # 'p', index, x, y, w, h, vel_y, ground, ceiling, speed, jump, flags, teleport
+BUFF = struct.Struct("<cBBii")          # 'b', slot, type, x, y
+REMOVED = struct.Struct("<cB")          # 'x', slot of a buff that is gone
+PORTALS = struct.Struct("<c?iiii")      # 'o', active, x1, y1, x2, y2
+RECORDS = {b"g": GLOBALS, b"p": PLAYER, b"b": BUFF, b"x": REMOVED, b"o": PORTALS}
+
+SHIELD, FROZEN, TELEPORTING = 1, 2, 4
+BUFF_TYPES = list(buff_defs)
+
+
+def make_snapshot(state):
+    # {key: packed record}; keys tell records apart so snapshots can be diffed
+    records = {b"g": GLOBALS.pack(b"g", state.tagger, state.tags, state.tagging, state.over)}
+    for p in state.players:
+        flags = ((SHIELD if "shield" in p.stats else 0) | (FROZEN if "frozen" in p.stats else 0)
+                 | (TELEPORTING if p.teleport["active"] else 0))
+        records[b"p%d" % p.index] = PLAYER.pack(
+            b"p", p.index, p.rect.x, p.rect.y, p.rect.width, p.rect.height, p.vel_y, p.on_ground,
+            p.on_ceiling, p.stats["speed"], p.stats["jump"], flags, p.teleport["progress"])
+    for buff in state.buffs.on_ground.values():
+        records[b"b%d" % buff.slot] = BUFF.pack(b"b", buff.slot, BUFF_TYPES.index(buff.type_name),
+                                                int(buff.pos[0]), int(buff.pos[1]))
+    (x1, y1), (x2, y2) = state.portals["positions"]
+    records[b"o"] = PORTALS.pack(b"o", state.portals["active"], x1, y1, x2, y2)
+    return records
+
+
+def encode_delta(records, baseline):
+    # the records that changed since baseline (all of them without one) + removals
+    out = []
+    for key, data in records.items():
+        if baseline is None or baseline.get(key) != data:
+            out.append(data)
+    if baseline is not None:
+        for key in baseline:
+            if key not in records:
+                out.append(REMOVED.pack(b"x", int(key[1:])))
+    return b"".join(out)
+
+
+def decode_delta(payload, baseline):
+    records = dict(baseline) if baseline is not None else {}
+    pos = 0
+    while pos < len(payload):
+        fmt = RECORDS[payload[pos:pos + 1]]
+        data = payload[pos:pos + fmt.size]
+        pos += fmt.size
+        if data[:1] == b"x":
+            records.pop(b"b%d" % data[1], None)
+        elif data[:1] == b"p" or data[:1] == b"b":
+            records[data[:1] + b"%d" % data[1]] = data
+        else:
+            records[data[:1]] = data
+    return records
+
+
+def apply_snapshot(state, frame, records):
+    # write a snapshot into a client-side GameState (which never runs step() itself)
+    state.frame = frame
+    for key, data in records.items():
+        kind = key[:1]
+        if kind == b"g":
+            _, state.tagger, state.tags, state.tagging, state.over = GLOBALS.unpack(data)
+        elif kind == b"p":
+            (_, i, x, y, w, h, vel_y, ground, ceiling, speed, jump, flags, progress) = PLAYER.unpack(data)
+            p = state.players[i]
+            if (w, h) != p.rect.size:
+                p.mask = player_mask(w, h)
+            p.rect.update(x, y, w, h)
+            p.vel_y, p.on_ground, p.on_ceiling = vel_y, ground, ceiling
+            p.stats["speed"], p.stats["jump"] = speed, jump
+            for flag, name in ((SHIELD, "shield"), (FROZEN, "frozen")):
+                if flags & flag:
+                    p.stats[name] = True
+                else:
+                    p.stats.pop(name, None)
+            p.teleport["active"] = bool(flags & TELEPORTING)
+            p.teleport["progress"] = progress
+        elif kind == b"o":
+            _, active, x1, y1, x2, y2 = PORTALS.unpack(data)
+            state.portals["active"] = active
+            state.portals["positions"] = [[x1, y1], [x2, y2]]
+    # buffs on the ground: only what is needed to draw them
+    pool = state.buffs
+    for buff in list(pool.live.values()):
+        pool.release(buff)
+    for key, data in records.items():
+        if key[:1] == b"b":
+            _, slot, type_index, x, y = BUFF.unpack(data)
+            buff = pool.acquire()
+            if buff is None:
+                break
+            name = BUFF_TYPES[type_index]
+            buff.pos[0], buff.pos[1] = x, y
+            buff.type_name, buff.config, buff.active = name, buff_defs[name], True
+            pool.add(buff)
+
+
+# --- SERVER ---
+class _Client:
+    def __init__(self, index):
+        self.index = index
+        self.inputs = {}       # seq -> keys, not used yet
+        self.next_seq = 1
+        self.last_seq = 0      # newest seq already applied
+        self.keys = 0          # held when no input has arrived for this tick
+        self.acked = NO_FRAME  # newest snapshot the client has
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class TagServer(asyncio.DatagramProtocol):
+    def __init__(self, level=0, players=2, seed=None, round_time=ROUND_TIME, min_clients=None):
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.level = level
+        self.round_time = round_time
+        self.state = GameState(level, seed=self.seed, round_time=round_time, players=players)
+        self.min_clients = players if min_clients is None else min_clients
+        self.clients = {}      # addr -> _Client
+        self.history = collections.OrderedDict()  # frame -> snapshot records
+        self.profiler = FrameProfiler(window=FPS * 5)
+        self.transport = None
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+
+    # --- datagram handling ---
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        kind = data[:1]
+        client = self.clients.get(addr)
+        if kind == JOIN:
+            if client is None:
+                taken = {c.index for c in self.clients.values()}
+                free = [i for i in range(len(self.state.players)) if i not in taken]
+                if not free:
+                    self.transport.sendto(FULL, addr)
+                    return
+                client = self.clients[addr] = _Client(free[0])
+                if len(self.clients) >= self.min_clients:
+                    self.started.set()
+            self._send(client, addr, WELCOME.pack(b"W", client.index, self.level, len(self.state.players),
+                                                  self.seed, self.round_time))
+        elif client is None:
+            return
+        elif kind == b"I" and len(data) >= INPUT.size:
+            client.bytes_in += len(data)
+            _, acked, seq, count = INPUT.unpack_from(data)
+            if acked != NO_FRAME and (client.acked == NO_FRAME or acked > client.acked):
+                client.acked = acked
+            keys = data[INPUT.size:INPUT.size + count]
+            for i, k in enumerate(keys):
+                s = seq - len(keys) + 1 + i
+                if s >= client.next_seq:
+                    client.inputs[s] = k
+        elif kind == LEAVE:
+            del self.clients[addr]
+
+    def _send(self, client, addr, data):
+        client.bytes_out += len(data)
+        self.transport.sendto(data, addr)
+
+    # --- tick ---
+    def _take_inputs(self):
+        inputs = [0] * len(self.state.players)
+        for client in self.clients.values():
+            pending = client.inputs
+            if len(pending) > MAX_INPUT_BACKLOG:
+                # fell behind (the client's clock runs fast or packets bunched up)
+                newest = max(pending)
+                for s in [s for s in pending if s < newest - MAX_INPUT_BACKLOG + 1]:
+                    del pending[s]
+                client.next_seq = min(pending)
+            if client.next_seq in pending:
+                client.keys = pending.pop(client.next_seq)
+                client.last_seq = client.next_seq
+                client.next_seq += 1
+            inputs[client.index] = client.keys
+        return inputs
+
+    def tick(self):
+        prof = self.profiler
+        with prof.section("inputs"):
+            inputs = self._take_inputs()
+        with prof.section("step"):
+            self.state.step(inputs)
+        with prof.section("send"):
+            prof.count("bytes out", self._broadcast())
+        prof.end_frame()
+
+    def _broadcast(self):
+        # snapshot of the current frame to every client, diffed against what it acked
+        frame = self.state.frame
+        records = self.history.get(frame)
+        if records is None:
+            records = self.history[frame] = make_snapshot(self.state)
+            while len(self.history) > SNAPSHOT_HISTORY:
+                self.history.popitem(last=False)
+        sent = 0
+        for addr, client in self.clients.items():
+            baseline = self.history.get(client.acked)
+            header = SNAPSHOT.pack(b"S", frame, client.acked if baseline is not None else NO_FRAME,
+                                   client.last_seq)
+            data = header + encode_delta(records, baseline)
+            self._send(client, addr, data)
+            sent += len(data)
+        return sent
+
+    async def run(self):
+        await self.started.wait()
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while not self.state.over:
+            self.tick()
+            next_tick += 1 / FPS
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -0.25:
+                next_tick = loop.time()  # hopelessly behind: stop trying to catch up
+            else:
+                await asyncio.sleep(0)
+        # keep repeating the final frame for a moment in case the last packets got lost
+        for _ in range(FPS // 2):
+            self._broadcast()
+            await asyncio.sleep(1 / FPS)
+        self.finished.set()
+
+    def report(self):
+        step50, step99 = self.profiler.percentiles("frame")
+        tick50, tick99 = (sum(x) for x in zip(*(self.profiler.percentiles(n) for n in ("inputs", "step", "send"))))
+        seconds = max(self.state.frame / FPS, 1e-9)
+        lines = [f"server: frame {self.state.frame}, tick work p50 {tick50:.3f} ms / p99 {tick99:.3f} ms, "
+                 f"tick interval p50 {step50:.2f} ms / p99 {step99:.2f} ms"]
+        for client in sorted(self.clients.values(), key=lambda c: c.index):
+            lines.append(f"  P{client.index + 1}: out {client.bytes_out / seconds / 1024:.2f} KB/s, "
+                         f"in {client.bytes_in / seconds / 1024:.2f} KB/s")
+        return "\n".join(lines)
+
+
+async def serve(host="0.0.0.0", port=PORT, report_every=5.0, **kwargs):
+    loop = asyncio.get_running_loop()
+    server = TagServer(**kwargs)
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=(host, port))
+    print(f"[server] listening on {host}:{port}, waiting for {server.min_clients} players")
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(report_every)
+            print(server.report())
+
+    task = asyncio.create_task(reporter()) if report_every else None
+    try:
+        await server.run()
+        print(server.report())
+    finally:
+        if task:
+            task.cancel()
+        transport.close()
+    return server
+
+
+# --- CLIENT ---
+class TagClient(asyncio.DatagramProtocol):
+    # Keeps a GameState that mirrors the server's latest snapshot, with its own
+    # player moved ahead by the inputs the server has not confirmed yet.
+    def __init__(self, loss=0.0, rng=None):
+        self.loss = loss        # drop this fraction of incoming packets (testing)
+        self.rng = rng or random.Random()
+        self.transport = None
+        self.index = None
+        self.state = None
+        self.welcome = asyncio.Event()
+        self.refused = False
+        self.snapshots = collections.OrderedDict()  # frame -> records
+        self.frame = NO_FRAME  # newest snapshot frame
+        self.seq = 0
+        self.pending = collections.deque()  # (seq, keys) the server has not used yet
+        self.sent_keys = collections.deque(maxlen=INPUT_REDUNDANCY)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_heard = time.perf_counter()
+        self.corrections = 0    # snapshots that moved the predicted player
+        self.correction_px = 0.0
+        self.started = time.perf_counter()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    async def join(self, timeout=5.0):
+        deadline = time.perf_counter() + timeout
+        while not self.welcome.is_set():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("no answer from the server")
+            self.transport.sendto(JOIN)
+            try:
+                await asyncio.wait_for(self.welcome.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+        if self.refused:
+            raise ConnectionRefusedError("the match is full")
+
+    def datagram_received(self, data, addr):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        self.bytes_in += len(data)
+        self.last_heard = time.perf_counter()
+        kind = data[:1]
+        if kind == b"W" and self.state is None:
+            _, self.index, level, players, seed, round_time = WELCOME.unpack(data)
+            self.state = GameState(level, seed=seed, round_time=round_time, players=players)
+            self.welcome.set()
+        elif kind == FULL:
+            self.refused = True
+            self.welcome.set()
+        elif kind == b"S" and self.state is not None:
+            self._on_snapshot(data)
+
+    def _on_snapshot(self, data):
+        _, frame, base, last_seq = SNAPSHOT.unpack_from(data)
+        if self.frame != NO_FRAME and frame < self.frame:
+            return  # late
+        baseline = None
+        if base != NO_FRAME:
+            baseline = self.snapshots.get(base)
+            if baseline is None:
+                return  # we no longer have what it was diffed against
+        records = decode_delta(data[SNAPSHOT.size:], baseline)
+        self.snapshots[frame] = records
+        while len(self.snapshots) > SNAPSHOT_HISTORY:
+            self.snapshots.popitem(last=False)
+        self.frame = frame
+
+        # reconcile: server state, then the inputs it has not applied yet on top
+        me = self.state.players[self.index]
+        predicted = me.rect.topleft
+        apply_snapshot(self.state, frame, records)
+        while self.pending and self.pending[0][0] <= last_seq:
+            self.pending.popleft()
+        for _, keys in self.pending:
+            self._predict(keys)
+        error = abs(me.rect.x - predicted[0]) + abs(me.rect.y - predicted[1])
+        if error:
+            self.corrections += 1
+            self.correction_px += error
+
+    def _predict(self, keys):
+        me = self.state.players[self.index]
+        self.state._move_player(me, keys)
+        me.rect.clamp_ip(self.state.world_rect)
+
+    def tick(self, keys):
+        # one local frame: send the keys and move our own player right away
+        self.seq += 1
+        self.pending.append((self.seq, keys))
+        self.sent_keys.append(keys)
+        data = INPUT.pack(b"I", self.frame, self.seq, len(self.sent_keys)) + bytes(self.sent_keys)
+        self.bytes_out += len(data)
+        self.transport.sendto(data)
+        self._predict(keys)
+
+    def leave(self):
+        self.transport.sendto(LEAVE)
+
+    def report(self):
+        seconds = max(time.perf_counter() - self.started, 1e-9)
+        avg = self.correction_px / self.corrections if self.corrections else 0.0
+        return (f"  client P{self.index + 1}: in {self.bytes_in / seconds / 1024:.2f} KB/s, "
+                f"out {self.bytes_out / seconds / 1024:.2f} KB/s, {len(self.pending)} inputs in flight, "
+                f"{self.corrections} corrections (avg {avg:.1f} px)")
+
+
+async def connect(host="127.0.0.1", port=PORT, **kwargs):
+    loop = asyncio.get_running_loop()
+    _, client = await loop.create_datagram_endpoint(lambda: TagClient(**kwargs), remote_addr=(host, port))
+    await client.join()
+    return client
+
+
+async def run_bot(client, seed=None, timeout=2.0):
+    # mash keys at the frame rate until the round is over (or the server goes quiet)
+    policy = random_policy(random.Random(seed), len(client.state.players))
+    next_tick = time.perf_counter()
+    while not client.state.over and time.perf_counter() - client.last_heard < timeout:
+        client.tick(policy(client.state)[client.index])
+        next_tick += 1 / FPS
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+
+
+async def play(host, port=PORT):
+    # a window for one player, arrow keys or WASD
+    from assets import AssetLoader
+    from render import Renderer
+
+    pygame.init()
+    client = await connect(host, port)
+    state = client.state
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(f"Tag - player {client.index + 1}")
+    assets = AssetLoader()
+    renderer = Renderer(screen, state.objects, [assets.get(f"portal{i}") for i in range(8)],
+                        {name: assets.get(f"buff_{name}") for name in buff_defs},
+                        pygame.font.SysFont("Comic Sans MS", 50), world_size=state.world_rect.size)
+    renderer.follow = [client.index]
+    renderer.redraw_all()
+    pygame.display.flip()
+    clock = pygame.time.Clock()
+    running = True
+    while running and not state.over:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+        keys = pygame.key.get_pressed()
+        bits = 0
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+            bits |= INPUT_LEFT
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+            bits |= INPUT_RIGHT
+        if keys[pygame.K_w] or keys[pygame.K_UP]:
+            bits |= INPUT_JUMP
+        client.tick(bits)
+        renderer.present(renderer.draw(state))
+        clock.tick(FPS)
+        await asyncio.sleep(0)
+    client.leave()
+    print(client.report())
+    pygame.quit()
+
+
+async def selftest(clients=4, seconds=10, level=2, port=PORT, loss=0.0, seed=0):
+    server_task = asyncio.create_task(serve("127.0.0.1", port, report_every=0, level=level, players=clients,
+                                            seed=seed, round_time=seconds))
+    await asyncio.sleep(0.1)
+    bots = [await connect("127.0.0.1", port, loss=loss, rng=random.Random(seed + i)) for i in range(clients)]
+    await asyncio.gather(*(run_bot(c, seed + i) for i, c in enumerate(bots)))
+    server = await server_task
+    await asyncio.sleep(0.1)
+    for c in bots:
+        print(c.report())
+    # after the last snapshot every client should agree with the server on where everyone is
+    truth = [tuple(p.rect) for p in server.state.players]
+    agree = sum(all(tuple(p.rect) == t or p.index == c.index for p, t in zip(c.state.players, truth))
+                for c in bots)
+    print(f"{agree}/{len(bots)} clients match the server's final player positions")
+    return agree == len(bots)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Networked tag: authoritative server, clients, localhost test.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--level", type=int, default=0)
+    p.add_argument("--players", type=int, default=2)
+    p.add_argument("--seed", type=int)
+    p.add_argument("--round-time", type=int, default=ROUND_TIME)
+    p = sub.add_parser("join")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=PORT)
+    p = sub.add_parser("test")
+    p.add_argument("--clients", type=int, default=4)
+    p.add_argument("--seconds", type=int, default=10)
+    p.add_argument("--level", type=int, default=2)
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--loss", type=float, default=0.0, help="fraction of server packets each client drops")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, level=args.level, players=args.players, seed=args.seed,
+                          round_time=args.round_time))
+    elif args.command == "join":
+        asyncio.run(play(args.host, args.port))
+    else:
+        ok = asyncio.run(selftest(args.clients, args.seconds, args.level, args.port, args.loss))
+        raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import collections
+import contextlib
+import csv
+import json
+import time
+
+import pygame
+
+# Per-frame timing of the main loop's phases plus free-form counters. Sections are
+# timed with perf_counter and kept in a rolling window for the p50/p99 overlay. With
+# history on, every frame is also logged for export() to write out as CSV or JSON;
+# leave it off for long sessions that only show the overlay, so memory stays flat.
+
+
+class FrameProfiler:
+    def __init__(self, window=300, history=False):
+        self.window = window
+        self.current = {}
+        self.last = {}
+        self.rolling = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.frames = [] if history else None  # every finished frame: {name: ms or count}
+        self.names = []   # column order, first seen first
+        self._frame_start = time.perf_counter()
+        self._overlay = None
+        self._overlay_age = 0
+
+    @contextlib.contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] = self.current.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name, n=1):
+        self.current[name] = self.current.get(name, 0) + n
+
+    def end_frame(self):
+        now = time.perf_counter()
+        self.current["frame"] = (now - self._frame_start) * 1000
+        self._frame_start = now
+        for name, value in self.current.items():
+            if name not in self.rolling:
+                self.names.append(name)
+            self.rolling[name].append(value)
+        if self.frames is not None:
+            self.frames.append(self.current)
+        self.last = self.current
+        self.current = {}
+
+    def percentiles(self, name):
+        values = sorted(self.rolling[name])
+        if not values:
+            return 0.0, 0.0
+        return values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.99))]
+
+    # --- OVERLAY ---
+    def draw(self, surface, font, pos=(10, 10), refresh=10):
+        # re-render the text only every `refresh` frames; returns the rect drawn on
+        self._overlay_age -= 1
+        if self._overlay is None or self._overlay_age <= 0:
+            self._overlay_age = refresh
+            lines = [f"{'':<12}{'last':>8}{'p50':>8}{'p99':>8}"]
+            for name in self.names:
+                p50, p99 = self.percentiles(name)
+                lines.append(f"{name:<12}{self.last.get(name, 0):>8.2f}{p50:>8.2f}{p99:>8.2f}")
+            rendered = [font.render(line, True, (255, 255, 255)) for line in lines]
+            width = max(r.get_width() for r in rendered) + 12
+            height = sum(r.get_height() for r in rendered) + 12
+            self._overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+            self._overlay.fill((0, 0, 0, 170))
+            y = 6
+            for r in rendered:
+                self._overlay.blit(r, (6, y))
+                y += r.get_height()
+        return surface.blit(self._overlay, pos)
+
+    # --- EXPORT ---
+    def export(self, path):
+        if self.frames is None:
+            raise ValueError("no per-frame history to export, create the profiler with history=True")
+        if path.endswith(".json"):
+            summary = {name: dict(zip(("p50", "p99"), self.percentiles(name))) for name in self.names}
+            with open(path, "w") as f:
+                json.dump({"frames": self.frames, "rolling": summary}, f)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=self.names)
+                writer.writeheader()
+                writer.writerows(self.frames)
+        print(f"[profile] wrote {len(self.frames)} frames to {path}")
+
+
+class NullProfiler:
+    # stands in when profiling is off so the game loop does not need if-checks
+    _null = contextlib.nullcontext()
+
+    def section(self, name):
+        return self._null
+
+    def count(self, name, n=1):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,391 @@
+import math
+from collections import OrderedDict
+
+import pygame
+
+from collision import CHUNK_SIZE, polygon_bounds
+from sim import FPS, BUFF_RADIUS
+
+# --- COLORS ---
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+SKYBLUE = (135, 206, 235)
+GRASSGREEN = (34, 139, 34)
+
+# players 1 and 2 keep red and blue, party matches cycle through the rest
+player_colors = [RED, BLUE, (0, 170, 0), (255, 140, 0), (160, 32, 240), (255, 105, 180), (0, 200, 200),
+                 (139, 69, 19), (128, 128, 0), (0, 0, 128), (220, 20, 60), (64, 224, 208),
+                 (255, 215, 0), (105, 105, 105), (199, 21, 133), (85, 107, 47)]
+
+TILE_SIZE = CHUNK_SIZE  # the background is painted in square tiles of this size (in world pixels)
+TILE_CACHE = 48  # painted tiles kept around (least recently used go first)
+CAMERA_SMOOTHING = 0.15  # share of the way to its target the camera moves per game tick
+SNAP_DISTANCE = 100  # moves longer than this in one tick (arriving from a portal) are not interpolated
+RESOLUTION_LEVELS = (1.0, 0.8, 0.65, 0.5)  # share of the output resolution drawn at, best first
+RESOLUTION_WINDOW = 30  # frames averaged before the resolution changes
+RESOLUTION_HEADROOM = 0.8  # share of the frame budget the work may use before dropping a level
+
+
+def fit_rect(size, into):
+    # the largest rect with the shape of `size` that fits in the middle of `into`
+    scale = min(into[0] / size[0], into[1] / size[1])
+    rect = pygame.Rect(0, 0, round(size[0] * scale), round(size[1] * scale))
+    rect.center = (into[0] // 2, into[1] // 2)
+    return rect
+
+
+class DynamicResolution:
+    # Picks the resolution the Renderer draws at from how long frames take: a level
+    # down (see RESOLUTION_LEVELS) when the work per frame averages more than
+    # RESOLUTION_HEADROOM of the budget, a level up when even at the higher
+    # resolution it would stay under that. The estimate scales the whole frame with
+    # the pixel count, which overstates what drawing costs, so it errs on the side
+    # of not going back up too early and the two never flip back and forth.
+    # A drop that does not make frames at least 10% faster is undone and the
+    # resolution stays above that level from then on: the time goes somewhere else.
+    def __init__(self, budget_ms=1000 / FPS, levels=RESOLUTION_LEVELS, window=RESOLUTION_WINDOW):
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.window = window
+        self.level = 0
+        self.lowest = len(levels) - 1
+        self.dropped_at = None  # mean frame time before the last drop, until it is judged
+        self.samples = []
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def update(self, frame_ms):
+        # frame_ms: time spent on the frame, not counting the wait for the next one.
+        # Returns True when quality changed.
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.window:
+            return False
+        mean = sum(self.samples) / len(self.samples)
+        self.samples.clear()
+        limit = self.budget_ms * RESOLUTION_HEADROOM
+        if self.dropped_at is not None:
+            before, self.dropped_at = self.dropped_at, None
+            if mean > before * 0.9:
+                self.level -= 1
+                self.lowest = self.level
+                return True
+        if mean > limit and self.level < self.lowest:
+            self.dropped_at = mean
+            self.level += 1
+            return True
+        if self.level > 0 and mean * (self.levels[self.level - 1] / self.quality) ** 2 < limit:
+            self.level -= 1
+            return True
+        return False
+
+
+class Camera:
+    # The part of the world on screen. follow() eases it towards the middle of the
+    # rects it is given and keeps it inside the world, so a world no bigger than the
+    # view never scrolls. Everything in here is in world pixels.
+    def __init__(self, view_size, world_size, smoothing=CAMERA_SMOOTHING):
+        self.rect = pygame.Rect((0, 0), view_size)
+        self.world = pygame.Rect((0, 0), world_size)
+        self.smoothing = smoothing
+        self.x = self.y = 0.0
+        self.placed = False
+
+    def follow(self, rects, ticks=1.0):
+        # ticks: game time since the last call, so the easing is the same at any frame rate
+        target = rects[0].unionall(rects[1:])
+        tx = max(0, min(self.world.width - self.rect.width, target.centerx - self.rect.width / 2))
+        ty = max(0, min(self.world.height - self.rect.height, target.centery - self.rect.height / 2))
+        if self.placed:
+            share = self.smoothing if ticks == 1 else 1 - (1 - self.smoothing) ** ticks
+            self.x += (tx - self.x) * share
+            self.y += (ty - self.y) * share
+        else:
+            # jump straight there the first time
+            self.x, self.y = tx, ty
+            self.placed = True
+        self.rect.topleft = (round(self.x), round(self.y))
+
+
+class Renderer:
+    # Draws a GameState onto `target`. The level is static, so it is painted once per
+    # TILE_SIZE tile, on first sight, and the tiles in view are put together into a
+    # background surface whenever the camera moves. With dirty_rects on and the camera
+    # still, each frame only restores the spots drawn on last frame and present()
+    # pushes just those rects to the display. Only what is in view gets drawn, so a
+    # world many screens wide costs no more per frame than one screen.
+    # Works on any Surface, so it also runs offscreen (benchmarks, headless tests).
+    #
+    # The game moves in whole ticks. When frames are drawn more often than that,
+    # call before_step() ahead of every GameState.step and pass draw() how far the
+    # next tick is along (alpha, 0..1): players and buffs are drawn that share of the
+    # way from where they were before the last tick to where they are now.
+    #
+    # `scale` is output pixels per world pixel, so a big view fits a small window.
+    # set_quality() below 1 draws into a smaller surface of its own instead, and
+    # present() scales that up to the target: fewer pixels to fill when frames are
+    # too slow (see DynamicResolution).
+    def __init__(self, target, objects, portal_frames, buff_images, font, dirty_rects=True, world_size=None,
+                 scale=1.0):
+        self.output = target
+        self.target = target  # what gets drawn on, the output or the smaller surface
+        self.portal_frames = portal_frames
+        self.buff_images = buff_images
+        self.dirty_rects = dirty_rects
+        self.scale = scale
+        self.quality = 1.0
+        self.zoom = scale  # target pixels per world pixel
+        view_size = (round(target.get_width() / scale), round(target.get_height() / scale))
+        self.camera = Camera(view_size, world_size or view_size)
+        self.follow = None  # indices of the players the camera keeps in view, None for all of them
+
+        from hud import Hud  # hud uses this module's colors, so it is imported late
+        self.hud = Hud(font, scoreboard=False)  # drawn over the world; just the clock unless replaced
+        self.overlay = []  # what the hud drew this frame (pushed to the display, not erased)
+        self.state = None  # the state last drawn, for the hud
+
+        # portal animation (purely visual, not part of the game state)
+        self.bobbing_time = 0
+        self.portal_frame_index = 0.0  # use float so you can advance by fractional steps
+        self.drawn_at = None  # game time (ticks) of the last draw
+
+        # positions before the last tick, see before_step()
+        self.prev_players = None
+        self.prev_buffs = {}
+
+        # --- BACKGROUND TILES ---
+        self.tile_objects = {}  # (tx, ty) -> polygons that reach into that tile
+        for verts in objects:
+            b = polygon_bounds(verts, *self.camera.world.size)
+            b.inflate_ip(4, 4)  # the outline is 3px wide and may stick out of the polygon
+            for tx in range(b.left // TILE_SIZE, (b.right - 1) // TILE_SIZE + 1):
+                for ty in range(b.top // TILE_SIZE, (b.bottom - 1) // TILE_SIZE + 1):
+                    self.tile_objects.setdefault((tx, ty), []).append(verts)
+        self.tiles = OrderedDict()  # (tx, ty) -> Surface, least recently used first
+        self.tile_builds = 0
+        self.sprites = {}  # id of a sprite -> the sprite at the current zoom
+        self.background = self._surface(target.get_size())
+        self.background_at = None  # camera position the background was put together for
+        self.last_rects = []  # what was drawn over the background last frame
+        self.flip_all = True  # the whole window changed since the last present()
+
+    @staticmethod
+    def _surface(size):
+        surf = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            surf = surf.convert()
+        return surf
+
+    def set_quality(self, quality):
+        # draw at `quality` times the output resolution from the next frame on
+        if quality == self.quality:
+            return
+        self.quality = quality
+        if quality >= 1:
+            self.target = self.output
+        else:
+            w, h = self.output.get_size()
+            self.target = self._surface((max(1, round(w * quality)), max(1, round(h * quality))))
+        self.zoom = self.scale * quality
+        self.tiles.clear()
+        self.sprites.clear()
+        self.background = self._surface(self.target.get_size())
+        self.background_at = None
+        self.last_rects = []
+
+    def _px(self, v):
+        return round(v * self.zoom)
+
+    def _sprite(self, img):
+        if self.zoom == 1:
+            return img
+        scaled = self.sprites.get(id(img))
+        if scaled is None:
+            w, h = img.get_size()
+            scaled = self.sprites[id(img)] = pygame.transform.scale(img, (max(1, self._px(w)), max(1, self._px(h))))
+        return scaled
+
+    def _tagger_marker(self, size):
+        # the triangle over the tagger's head, drawn once per size
+        key = ("tagger", size)
+        marker = self.sprites.get(key)
+        if marker is None:
+            tip = self._px(30) - self._px(20)
+            marker = self.sprites[key] = pygame.Surface((size + 1, tip + 1), pygame.SRCALPHA)
+            triangle = [(0, 0), (size // 2, tip), (size, 0)]
+            pygame.draw.polygon(marker, WHITE, triangle)
+            pygame.draw.polygon(marker, BLACK, triangle, 1)
+        return marker
+
+    def _tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        # tiles start and end on rounded edges so neighbours meet without gaps at any zoom
+        left, top = self._px(key[0] * TILE_SIZE), self._px(key[1] * TILE_SIZE)
+        size = (self._px((key[0] + 1) * TILE_SIZE) - left, self._px((key[1] + 1) * TILE_SIZE) - top)
+        tile = self.tiles[key] = self._surface(size)
+        tile.fill(SKYBLUE)
+        outline = max(1, self._px(3))
+        for verts in self.tile_objects.get(key, ()):
+            shifted = [(self._px(x) - left, self._px(y) - top) for x, y in verts]
+            pygame.draw.polygon(tile, GRASSGREEN, shifted)
+            pygame.draw.polygon(tile, BLACK, shifted, outline)
+        self.tile_builds += 1
+        if len(self.tiles) > TILE_CACHE:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def _compose_background(self):
+        view = self.camera.rect
+        ox, oy = self._px(view.x), self._px(view.y)
+        for tx in range(view.left // TILE_SIZE, (view.right - 1) // TILE_SIZE + 1):
+            for ty in range(view.top // TILE_SIZE, (view.bottom - 1) // TILE_SIZE + 1):
+                self.background.blit(self._tile((tx, ty)), (self._px(tx * TILE_SIZE) - ox, self._px(ty * TILE_SIZE) - oy))
+        self.background_at = view.topleft
+
+    def redraw_all(self):
+        if self.background_at != self.camera.rect.topleft:
+            self._compose_background()
+        self.target.blit(self.background, (0, 0))
+        self.last_rects = []
+        self.flip_all = True
+
+    def before_step(self, state):
+        self.prev_players = [p.rect.topleft for p in state.players]
+        self.prev_buffs = {slot: (buff.pos[0], buff.pos[1]) for slot, buff in state.buffs.on_ground.items()}
+
+    def _player_rect(self, player, alpha):
+        # the world rect to draw a player at
+        rect = player.rect
+        if alpha >= 1 or self.prev_players is None:
+            return rect
+        x, y = self.prev_players[player.index]
+        dx, dy = x - rect.x, y - rect.y
+        if abs(dx) + abs(dy) > SNAP_DISTANCE:
+            return rect
+        return rect.move(round(dx * (1 - alpha)), round(dy * (1 - alpha)))
+
+    def _screen_rect(self, rect, ox, oy):
+        # a world rect on the target, with edges rounded like the tiles'
+        left, top = self._px(rect.left), self._px(rect.top)
+        return pygame.Rect(left - ox, top - oy, self._px(rect.right) - left, self._px(rect.bottom) - top)
+
+    def draw_buffs(self, buffs, alpha=1.0):
+        # returns the rects that were drawn on
+        screen = self.target
+        view = self.camera.rect
+        ox, oy = self._px(view.x), self._px(view.y)
+        radius = max(1, self._px(BUFF_RADIUS))
+        drawn = []
+        for buff in buffs:
+            x, y = buff.pos
+            prev = self.prev_buffs.get(buff.slot) if alpha < 1 else None
+            if prev is not None and abs(prev[0] - x) + abs(prev[1] - y) <= SNAP_DISTANCE:
+                x += (prev[0] - x) * (1 - alpha)
+                y += (prev[1] - y) * (1 - alpha)
+            x, y = int(x), int(y)
+            if not (view.left - BUFF_RADIUS < x < view.right + BUFF_RADIUS and
+                    view.top - BUFF_RADIUS < y < view.bottom + BUFF_RADIUS):
+                continue
+            x, y = self._px(x) - ox, self._px(y) - oy
+            img = self.buff_images.get(buff.type_name)
+            if img is not None:
+                img = self._sprite(img)
+                drawn.append(screen.blit(img, img.get_rect(center=(x, y))))
+            else:
+                drawn.append(pygame.draw.circle(screen, buff.config["color"], (x, y), radius))
+                drawn.append(pygame.draw.circle(screen, BLACK, (x, y), radius, max(1, self._px(2))))
+        return drawn
+
+    def draw(self, state, alpha=1.0):
+        # erase last frame and draw this one; returns the rects drawn on
+        screen = self.target
+        camera = self.camera
+        now = state.frame - 1 + alpha
+        ticks = 1.0 if self.drawn_at is None else max(0.0, now - self.drawn_at)
+        self.drawn_at = now
+        rects = [self._player_rect(p, alpha) for p in state.players]
+        follow = rects if self.follow is None else [rects[i] for i in self.follow]
+        camera.follow(follow, ticks)
+        # erase only what moved (or the whole window when dirty rects are off or the camera moved)
+        if camera.rect.topleft != self.background_at:
+            self.redraw_all()
+        elif self.dirty_rects:
+            for rect in self.last_rects:
+                screen.blit(self.background, rect, rect)
+        else:
+            screen.blit(self.background, (0, 0))
+        view = camera.rect
+        px = self._px
+        ox, oy = px(view.x), px(view.y)
+        drawn = []
+
+        tagger_rect = self._screen_rect(rects[state.tagger], ox, oy)
+        marker = self._tagger_marker(px(state.players[state.tagger].base_size))
+        drawn.append(screen.blit(marker, (tagger_rect.x, tagger_rect.y - px(30))))
+
+        # players draw
+        for p in state.players:
+            if not view.colliderect(rects[p.index]):
+                continue
+            color = player_colors[p.index % len(player_colors)]
+            rect = self._screen_rect(rects[p.index], ox, oy)
+            if p.teleport["active"]:
+                size = int(px(p.base_size) * (1 - p.teleport["progress"] * 0.8))
+                drawn.append(pygame.draw.rect(screen, WHITE, pygame.Rect(rect.centerx - size // 2, rect.centery - size // 2, size, size)))
+            else:
+                drawn.append(pygame.draw.rect(screen, color, rect))
+                drawn.append(pygame.draw.rect(screen, BLACK, rect, max(1, px(2))))
+
+        # --- draw portals ---
+        portals = state.portals
+        if portals["active"]:
+            self.bobbing_time += 0.05 * ticks
+            bob_offset = math.sin(self.bobbing_time) * 5
+
+            # Update frame index (speed controls animation speed)
+            self.portal_frame_index = (self.portal_frame_index + 0.2 * ticks) % len(self.portal_frames)
+            current_frame = self._sprite(self.portal_frames[int(self.portal_frame_index)])
+
+            # Calculate bob positions
+            portal1_draw = (px(portals["positions"][0][0]) - ox, px(portals["positions"][0][1] + bob_offset) - oy)
+            portal2_draw = (px(portals["positions"][1][0]) - ox, px(portals["positions"][1][1] - bob_offset) - oy)
+
+            # Draw both portals (when they are in view)
+            for center in (portal1_draw, portal2_draw):
+                rect = current_frame.get_rect(center=center)
+                if screen.get_rect().colliderect(rect):
+                    drawn.append(screen.blit(current_frame, rect))
+
+        # draw buffs (new system)
+        drawn.extend(self.draw_buffs(state.buffs.on_ground.values(), alpha))
+
+        # the hud goes over everything; when drawing small it waits for present()
+        self.state = state
+        self.overlay = []
+        if self.hud is not None and screen is self.output:
+            self.overlay = self.hud.draw(screen, state, self.last_rects + drawn, self.flip_all)
+        return drawn
+
+    def present(self, drawn):
+        # the output may be a subsurface of the window (letterboxed), rects are moved onto it
+        output = self.output
+        area = output.get_rect(topleft=output.get_abs_offset())
+        if self.target is not output:
+            # blow the small frame up to the output, which is all new every frame
+            pygame.transform.scale(self.target, output.get_size(), output)
+            if self.hud is not None:
+                self.hud.draw(output, self.state, (), full=True)
+            pygame.display.update(area)
+        elif self.dirty_rects and not self.flip_all:
+            # push last frame's spots (now erased), this frame's sprites and the hud to the display
+            pygame.display.update([r.move(area.topleft) for r in self.last_rects + drawn + self.overlay])
+        else:
+            pygame.display.update(area)
+        self.last_rects = drawn
+        self.flip_all = False
@@ -0,0 +1,291 @@
+import argparse
+import copy
+import glob
+import hashlib
+import json
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from sim import FPS, ROUND_TIME, GameState, buff_defs, level_configs, random_policy
+
+# Every bit of randomness in a round comes from GameState.rng, so a round is fully
+# described by its seed, its level config and the keys held on each frame. A
+# recording stores exactly that, plus a digest of the final state so a replay can
+# check it ended up in the same place.
+#
+# File layout (little endian):
+#   header   magic "TAGR", version, level, players, seed, round_time, frames,
+#            digest (16 bytes), length of the config JSON, level file hash (16
+#            bytes), length of the level name
+#   name     the level's name, so a recording of level_configs[level] is only
+#            replayed on that same level file (levels are numbered by file name)
+#   config   JSON of the level config, empty when the round used level_configs[level]
+#   inputs   zlib of one INPUT_* byte per player per frame
+#
+#   python replay.py replays/                  re-simulate and verify every .tagr in there
+#   python replay.py game.tagr --seek 1800     print the state at frame 1800
+#   python replay.py --record 1000 --out corpus --level 3   make random recordings
+
+MAGIC = b"TAGR"
+# Bump whenever the file layout, state_digest or the outcome of a round changes, so
+# older recordings are turned away as an old format instead of failing as a mismatch:
+#   1  first format
+#   2  the digest covers live buffs and the pool counters, not every buff ever spawned
+#   3  player stats are derived from the buff modifier stack
+#   4  a size buff that does not fit pushes the player out with unstick()
+#   5  the header names the level file and holds its hash
+VERSION = 5
+HEADER = struct.Struct("<4sHBBQII16sI16sB")
+SNAPSHOT_EVERY = FPS * 10
+
+
+# --- STATE ---
+def _shared(attrs):
+    # things a snapshot must not copy: static level data, the profiler, buff configs
+    # (static dicts every BuffInstance points at; copies would only duplicate buff_defs
+    # in each snapshot) and player masks (never changed in place, only replaced)
+    keep = [attrs["level_collision"], attrs["profiler"], attrs["objects"], attrs["config"], *buff_defs.values()]
+    keep += [p.mask for p in attrs["players"]]
+    return {id(obj): obj for obj in keep}
+
+
+def snapshot(state):
+    return copy.deepcopy(state.__dict__, _shared(state.__dict__))
+
+
+def restore(state, snap):
+    # copy again so the snapshot can be restored more than once
+    state.__dict__.update(copy.deepcopy(snap, _shared(snap)))
+
+
+def state_digest(state):
+    # everything that can differ between two runs of the same round
+    players = [(tuple(p.rect), p.vel_y, p.on_ground, p.on_ceiling, sorted(p.stats.items()),
+                sorted(p.teleport.items())) for p in state.players]
+    buffs = [(b.pos, b.type_name, b.active, b.timer, b.applied_to) for b in state.buffs]
+    buffs.append((state.buffs.spawned, state.buffs.dropped))
+    portals = (state.portals["active"], state.portals["cooldown"], state.portals["positions"])
+    data = (state.frame, state.over, state.tagger, state.tagging, state.tags,
+            players, buffs, portals, state.rng.getstate())
+    return hashlib.blake2b(repr(data).encode(), digest_size=16).digest()
+
+
+# --- RECORDING ---
+class Recording:
+    def __init__(self, level=0, seed=None, round_time=ROUND_TIME, config=None, players=2):
+        if seed is None:
+            seed = random.getrandbits(63)
+        self.level = level
+        self.seed = seed
+        self.round_time = round_time
+        self.config = config  # None means level_configs[level], checked by name and file hash
+        self.players = players
+        self.level_name = ""
+        self.level_hash = bytes(16)
+        if config is None:
+            self.level_name = level_configs[level]["name"]
+            self.level_hash = bytes.fromhex(level_configs[level]["hash"])
+        self.inputs = bytearray()
+        self.digest = bytes(16)
+
+    @property
+    def frames(self):
+        return len(self.inputs) // self.players
+
+    def new_state(self):
+        return GameState(self.level, seed=self.seed, round_time=self.round_time, config=self.config,
+                         players=self.players)
+
+    def record(self, inputs):
+        self.inputs.extend(inputs)
+
+    def finish(self, state):
+        self.digest = state_digest(state)
+
+    def frame_inputs(self, frame):
+        return self.inputs[frame * self.players:(frame + 1) * self.players]
+
+    def save(self, path):
+        config = b""
+        if self.config is not None:
+            config = json.dumps(self.config).encode()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            name = self.level_name.encode()
+            f.write(HEADER.pack(MAGIC, VERSION, self.level, self.players, self.seed, self.round_time,
+                                self.frames, self.digest, len(config), self.level_hash, len(name)))
+            f.write(name)
+            f.write(config)
+            f.write(zlib.compress(bytes(self.inputs), 9))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        (magic, version, level, players, seed, round_time, frames, digest, config_len,
+         level_hash, name_len) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a recording")
+        if version != VERSION:
+            raise ValueError(f"{path}: version {version} recording, this build replays version {VERSION} "
+                             f"(re-record it)")
+        pos = HEADER.size + name_len
+        name = data[HEADER.size:pos].decode()
+        config = json.loads(data[pos:pos + config_len]) if config_len else None
+        if config is not None:
+            config["objects"] = [[tuple(v) for v in verts] for verts in config["objects"]]
+        else:
+            # the level files are numbered by name order: make sure it is still the same file
+            current = level_configs[level] if level < len(level_configs) else None
+            if current is None or current["name"] != name:
+                found = current["name"] if current is not None else "no such level"
+                raise ValueError(f"{path}: recorded on level {level} {name!r}, but level {level} is now {found!r}")
+            if bytes.fromhex(current["hash"]) != level_hash:
+                raise ValueError(f"{path}: level {name!r} ({current['path']}) changed since it was recorded")
+        rec = cls(level, seed, round_time, config, players)
+        rec.inputs = bytearray(zlib.decompress(data[pos + config_len:]))
+        rec.digest = digest
+        if rec.frames != frames:
+            raise ValueError(f"{path}: expected {frames} frames of input, found {rec.frames}")
+        return rec
+
+
+def record_round(path, level=0, seed=None, round_time=ROUND_TIME, config=None, players=2):
+    # play a round with the random policy and save it, for building regression corpora
+    rec = Recording(level, seed, round_time, config, players)
+    state = rec.new_state()
+    policy = random_policy(random.Random(rec.seed), players)
+    running = True
+    while running:
+        inputs = policy(state)
+        rec.record(inputs)
+        running = state.step(inputs)
+    rec.finish(state)
+    rec.save(path)
+    return rec
+
+
+# --- REPLAY ---
+class Replay:
+    # Re-simulates a recording headlessly. A snapshot is kept every `snapshot_every`
+    # frames on the way, so seek() only replays from the nearest one at or before
+    # the target instead of from the start.
+    def __init__(self, rec, snapshot_every=SNAPSHOT_EVERY):
+        self.rec = rec
+        self.snapshot_every = snapshot_every
+        self.state = rec.new_state()
+        self.snapshots = {0: snapshot(self.state)}
+
+    def step(self):
+        state = self.state
+        if state.frame >= self.rec.frames:
+            return False
+        state.step(self.rec.frame_inputs(state.frame))
+        if self.snapshot_every and state.frame % self.snapshot_every == 0 and state.frame not in self.snapshots:
+            self.snapshots[state.frame] = snapshot(state)
+        return True
+
+    def seek(self, frame):
+        frame = max(0, min(frame, self.rec.frames))
+        start = max(f for f in self.snapshots if f <= frame)
+        # carrying on from where we are beats restoring an older snapshot
+        if not start <= self.state.frame <= frame:
+            restore(self.state, self.snapshots[start])
+        while self.state.frame < frame:
+            self.step()
+        return self.state
+
+    def run(self):
+        return self.seek(self.rec.frames)
+
+    def verify(self):
+        return state_digest(self.run()) == self.rec.digest
+
+
+# --- CLI ---
+def _verify_file(path):
+    # (path, True / False / the reason it could not be loaded, frames, seconds)
+    start = time.perf_counter()
+    try:
+        rec = Recording.load(path)
+    except ValueError as e:
+        return path, str(e), 0, time.perf_counter() - start
+    ok = Replay(rec, snapshot_every=0).verify()
+    return path, ok, rec.frames, time.perf_counter() - start
+
+
+def _record_file(job):
+    path, level, seed, round_time, players = job
+    return record_round(path, level, seed, round_time, players=players).frames
+
+
+def _expand(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "**", "*.tagr"), recursive=True))
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify, seek in or create recorded rounds.")
+    parser.add_argument("paths", nargs="*", help=".tagr files or directories of them")
+    parser.add_argument("--seek", type=int, metavar="FRAME", help="print the state of a single recording at FRAME")
+    parser.add_argument("--record", type=int, metavar="N", help="record N rounds of random play into --out")
+    parser.add_argument("--out", default="replays")
+    parser.add_argument("--level", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--round-time", type=int, default=ROUND_TIME)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.record:
+        jobs = [(os.path.join(args.out, f"level{args.level}_{args.seed + r}.tagr"), args.level, args.seed + r,
+                 args.round_time, args.players) for r in range(args.record)]
+        with ProcessPoolExecutor(args.workers) as pool:
+            frames = sum(pool.map(_record_file, jobs, chunksize=8))
+        print(f"recorded {len(jobs)} rounds ({frames} frames) to {args.out} "
+              f"in {time.perf_counter() - start:.2f}s")
+        return
+
+    paths = list(_expand(args.paths))
+    if not paths:
+        parser.error("no recordings given")
+
+    if args.seek is not None:
+        replay = Replay(Recording.load(paths[0]))
+        state = replay.seek(args.seek)
+        print(f"frame {state.frame}: tagger P{state.tagger + 1}, tags {state.tags}")
+        for p in state.players:
+            print(f"  P{p.index + 1} rect {tuple(p.rect)} vel_y {p.vel_y:.2f} ground {p.on_ground} "
+                  f"ceiling {p.on_ceiling} stats {p.stats}")
+        return
+
+    failed = []
+    frames = 0
+    with ProcessPoolExecutor(args.workers) as pool:
+        for path, ok, n, elapsed in pool.map(_verify_file, paths, chunksize=8):
+            frames += n
+            if isinstance(ok, str):
+                failed.append(path)
+                print(f"REJECTED {ok}")
+            elif not ok:
+                failed.append(path)
+                print(f"MISMATCH {path} ({n} frames)")
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths) - len(failed)}/{len(paths)} recordings match, {frames} frames "
+          f"in {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+import argparse
+import dataclasses
+import functools
+import math
+import random
+import time
+from typing import Optional
+
+import pygame
+
+from collision import resolve_collision
+from levels import load_collision, load_levels
+from profiler import NULL_PROFILER, FrameProfiler
+
+# Everything in here runs without a display: only Rect, Surface and Mask are used,
+# none of which need pygame.display or pygame.init().
+
+WIDTH, HEIGHT = 1400, 1400
+FPS = 60
+ROUND_TIME = 60  # seconds
+SWEPT_COLLISION = True  # False forces the old per-pixel mask stepping for every polygon
+
+# --- INPUTS ---
+# one small int per player per frame, so inputs are cheap to store and replay
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+
+# --- LEVELS ---
+# one config dict per file in levels/, see levels.py for the format
+level_configs = load_levels()
+
+# --- PORTALS ---
+PORTAL_RADIUS = 20
+
+# --- BUFFS ---
+BUFF_RADIUS = 30
+MAX_ACTIVE_BUFFS = 3
+PLAYER_MASK_CACHE_SIZE = 64  # player sizes whose mask is kept around (least recently used go first)
+BUFF_POOL_SIZE = 32  # most buffs alive (on the ground or held) at once; spawns beyond that are dropped
+
+
+@dataclasses.dataclass(slots=True)
+class BuffInstance:
+    pos: list            # [x, y]
+    type_name: str
+    active: bool         # on-ground (not applied)
+    timer: int           # countdown while applied (0 if not applied)
+    bobbing_offset: float
+    config: dict
+    applied_to: Optional[int] = None  # index of the player holding it
+    slot: int = -1       # index in the BuffPool that owns it
+
+
+@dataclasses.dataclass
+class PlayerState:
+    rect: pygame.Rect
+    mask: pygame.mask.Mask
+    stats: dict          # speed / jump, plus shield / frozen while buffed
+    base_size: int
+    max_fall: float
+    index: int = 0
+    vel_y: float = 0
+    on_ground: bool = False
+    on_ceiling: bool = False
+    modifiers: list = dataclasses.field(default_factory=list)  # Modifiers from the buffs affecting it
+    it_frames: int = 0   # frames spent as the tagger
+    tags: int = 0        # players it has tagged
+    teleport: dict = dataclasses.field(default_factory=lambda: {"active": False, "target": None, "progress": 0})
+
+
+def make_player_mask(width, height):
+    # players are plain rectangles, so a filled mask is the same as drawing one and
+    # calling mask.from_surface, without the surface
+    return pygame.Mask((width, height), fill=True)
+
+
+@functools.lru_cache(maxsize=PLAYER_MASK_CACHE_SIZE)
+def player_mask(width, height):
+    # every player of a given size shares one mask; masks are only ever replaced, never drawn on
+    return make_player_mask(width, height)
+
+
+# --- BUFF EFFECTS ---
+# A buff does nothing to a player directly. Picking it up pushes its modifiers onto
+# the stacks of the players it affects and expiry pops them again; a player's stats
+# are recomputed from base values and the stack only when the stack changes, so
+# overlapping buffs (two speeds, a freeze on top of a speed) undo cleanly.
+#
+# effects: (who, stat, op, conf key holding the value) with who "self" or "enemy"
+# (every other player):
+#   mul   stats[stat] *= value        add   size += value (w, h)        flag   stats[stat] = True
+
+@dataclasses.dataclass(slots=True)
+class Modifier:
+    stat: str
+    op: str
+    value: object
+    source: object  # the BuffInstance that added it
+
+
+def derive_stats(player):
+    # rewrite player.stats in place from base values plus every modifier on the
+    # player's stack; returns the (w, h) the player should have
+    stats = player.stats
+    stats["speed"] = stats["base_speed"]
+    stats["jump"] = stats["base_jump"]
+    for stat in FLAG_STATS:
+        stats.pop(stat, None)
+    w = h = player.base_size
+    for mod in player.modifiers:
+        if mod.op == "mul":
+            stats[mod.stat] *= mod.value
+        elif mod.op == "add":
+            w += mod.value[0]
+            h += mod.value[1]
+        else:
+            stats[mod.stat] = True
+    return w, h
+
+
+def resize_player(state, player, width, height):
+    # Keep the horizontal center and the side the player stands on: the bottom, or the
+    # top when gravity is flipped, so players grow away from their floor. If the new size
+    # overlaps the level, take the shortest way out (LevelCollision.unstick). If there
+    # is none the player keeps its size until the next buff change; it never gets
+    # pushed through a platform. Returns whether the size changed.
+    player_rect = player.rect
+    new_rect = pygame.Rect(0, 0, width, height)
+    new_rect.centerx = player_rect.centerx
+    up = -1 if state.gravity >= 0 else 1
+    if up < 0:
+        new_rect.bottom = player_rect.bottom
+    else:
+        new_rect.top = player_rect.top
+
+    new_mask = player_mask(width, height)
+    if (width > player_rect.width or height > player_rect.height) and state.level_collision.overlaps(new_rect, new_mask):
+        push = state.level_collision.unstick(new_rect, new_mask, up)
+        if push is None:
+            return False
+        new_rect.move_ip(push)
+
+    player_rect.update(new_rect)
+    player.mask = new_mask
+    return True
+
+
+buff_defs = {
+    "speed": {
+        "color": (255, 215, 0),
+        "duration": FPS * 5,
+        "multiplier": 2,
+        "effects": [("self", "speed", "mul", "multiplier")],
+    },
+    "jump": {
+        "color": (0, 255, 255),
+        "duration": FPS * 5,
+        "multiplier": 1.5,
+        "effects": [("self", "jump", "mul", "multiplier")],
+    },
+    "size": {
+        "color": (255, 0, 255),
+        "duration": FPS * 5,
+        "inflate": (15, 15),
+        "effects": [("self", "size", "add", "inflate")],
+    },
+    "shield": {
+        "color": (150, 150, 255),
+        "duration": FPS * 10,
+        "effects": [("self", "shield", "flag", None)],
+    },
+    "freeze": {
+        "color": (100, 200, 255),
+        "duration": FPS * 3,        # lasts 3 seconds
+        "slow_factor": 0.1,         # slows opponent to 10% of normal speed
+        "effects": [("enemy", "speed", "mul", "slow_factor"), ("enemy", "frozen", "flag", None)],
+    }
+}
+FLAG_STATS = sorted({stat for conf in buff_defs.values() for _, stat, op, _ in conf["effects"] if op == "flag"})
+
+
+def roll_buff(spans, gravity=0.5, rng=random, height=HEIGHT):
+    # the random draws of one spawn: (x, y, type name, bobbing offset)
+    min_x, max_x, top_y, bottom_y = rng.choice(spans)
+
+    if gravity >= 0:
+        # spawn above the platform (normal)
+        y = top_y - 20
+    else:
+        # spawn below the platform (gravity flipped)
+        y = bottom_y + 20
+
+    # clamp so buffs don't spawn outside the world
+    y = max(BUFF_RADIUS, min(height - BUFF_RADIUS, y))
+    x = rng.randint(min_x + 20, max_x - 20)
+
+    type_name = rng.choice(list(buff_defs.keys()))
+    bobbing_offset = rng.uniform(0, 2*math.pi)
+    return x, y, type_name, bobbing_offset
+
+
+def spawn_buff(spans, gravity=0.5, rng=random, buff=None, height=HEIGHT):
+    x, y, type_name, bobbing_offset = roll_buff(spans, gravity, rng, height)
+    conf = buff_defs[type_name]
+    if buff is None:
+        return BuffInstance(pos=[x, y], type_name=type_name, active=True, timer=0,
+                            bobbing_offset=bobbing_offset, config=conf, applied_to=None)
+    # refill a recycled instance instead of making a new one
+    buff.pos[0], buff.pos[1] = x, y
+    buff.type_name = type_name
+    buff.active = True
+    buff.timer = 0
+    buff.bobbing_offset = bobbing_offset
+    buff.config = conf
+    buff.applied_to = None
+    return buff
+
+
+class BuffPool:
+    # A fixed set of BuffInstances that get reused once a buff expires. Live buffs are
+    # tracked in dicts keyed by slot (insertion ordered, so iteration follows spawn
+    # order like the old list did): per-frame work only touches live buffs and the
+    # memory use never grows, however long the session.
+    def __init__(self, capacity=BUFF_POOL_SIZE):
+        self.slots = [BuffInstance([0, 0], "", False, 0, 0.0, None, slot=i) for i in range(capacity)]
+        self.free = list(range(capacity - 1, -1, -1))
+        self.live = {}       # slot -> buff, on the ground or held
+        self.on_ground = {}  # waiting to be picked up
+        self.applied = {}    # held by a player, timer counting down
+        self.spawned = 0
+        self.picked_up = 0
+        self.expired = 0
+        self.dropped = 0     # spawns skipped because every slot was taken
+
+    def __len__(self):
+        return len(self.live)
+
+    def __iter__(self):
+        return iter(self.live.values())
+
+    def acquire(self):
+        # a free instance to fill in, or None when the pool is full
+        if not self.free:
+            self.dropped += 1
+            return None
+        return self.slots[self.free.pop()]
+
+    def add(self, buff):
+        self.live[buff.slot] = buff
+        self.on_ground[buff.slot] = buff
+        self.spawned += 1
+
+    def pick_up(self, buff, player_index):
+        del self.on_ground[buff.slot]
+        self.applied[buff.slot] = buff
+        buff.active = False
+        buff.timer = buff.config["duration"]
+        buff.applied_to = player_index
+        self.picked_up += 1
+
+    def release(self, buff):
+        del self.live[buff.slot]
+        self.on_ground.pop(buff.slot, None)
+        self.applied.pop(buff.slot, None)
+        buff.active = False
+        buff.applied_to = None
+        buff.timer = 0
+        self.free.append(buff.slot)
+        self.expired += 1
+
+    def counters(self):
+        return {"buffs on ground": len(self.on_ground), "buffs applied": len(self.applied),
+                "buffs spawned": self.spawned}
+
+
+def get_random_portal_position(spans, offset_y=15, rng=random):
+    min_x, max_x, top_y, _ = rng.choice(spans)
+    x = rng.randint(min_x + 20, max_x - 20)
+    y = top_y - offset_y
+    return [x, y]
+
+
+def handle_portal_teleport(player, teleport, portals):
+    if teleport["active"]:
+        teleport["progress"] += 0.02
+        if teleport["progress"] >= 1:
+            teleport["active"] = False
+            teleport["progress"] = 0
+            player.center = teleport["target"]
+        else:
+            player.centerx += (teleport["target"][0] - player.centerx) * 0.1
+            player.centery += (teleport["target"][1] - player.centery) * 0.1
+        return
+    if not portals["active"]:
+        return
+    px, py = player.center
+    for i, (px_portal, py_portal) in enumerate(portals["positions"]):
+        dist = ((px - px_portal) ** 2 + (py - py_portal) ** 2) ** 0.5
+        if dist < PORTAL_RADIUS + player.width // 2:
+            teleport["active"] = True
+            teleport["progress"] = 0
+            teleport["target"] = (
+                portals["positions"][1][0], portals["positions"][1][1] - 30
+            ) if i == 0 else (
+                portals["positions"][0][0], portals["positions"][0][1] - 30
+            )
+            portals["active"] = False
+            portals["cooldown"] = FPS * 10
+            break
+
+
+# --- GAME STATE ---
+class GameState:
+    # One round of tag. step() advances exactly one frame (1/FPS of game time) and
+    # never waits, so a round can be simulated as fast as the CPU allows.
+    # `players` is the entity store: one PlayerState per player, any number of them.
+    def __init__(self, level=0, seed=None, round_time=ROUND_TIME, config=None, players=2):
+        self.config = dict(config if config is not None else level_configs[level])
+        self.rng = random.Random(seed)
+        self.objects = self.config["objects"]
+        self.gravity = self.config["gravity"]
+        # the world can be bigger than the window, render.Camera scrolls over it
+        self.width = self.config.get("width", WIDTH)
+        self.height = self.config.get("height", HEIGHT)
+        self.level_collision = load_collision(self.config, self.width, self.height, swept=SWEPT_COLLISION)
+        self.world_rect = pygame.Rect(0, 0, self.width, self.height)
+        self.frame = 0
+        self.round_frames = round_time * FPS
+        self.over = False
+        self.profiler = NULL_PROFILER  # swap in a FrameProfiler to time step()'s phases
+
+        size = self.config["playerSize"]
+        self.players = []
+        for i in range(players):
+            # spread out from the middle: +20, -20, +60, -60, ...
+            x = self.width // 2 + (20 + 40 * (i // 2)) * (1 if i % 2 == 0 else -1)
+            stats = {"speed": self.config["playerSpeed"], "jump": self.config["playerJump"],
+                     "base_speed": self.config["playerSpeed"], "base_jump": self.config["playerJump"]}
+            self.players.append(PlayerState(
+                rect=pygame.Rect(x, self.height // 2, size, size),
+                mask=player_mask(size, size),
+                stats=stats,
+                base_size=size,
+                max_fall=self.config["playerMaxFall"],
+                index=i,
+            ))
+        self._collision_sections = [f"collision{i + 1}" for i in range(len(self.players))]
+        # per tagger: everyone else and their rects (rects are only changed in place)
+        self._others = [[p for p in self.players if p.index != i] for i in range(players)]
+        self._other_rects = [[p.rect for p in others] for others in self._others]
+
+        self.tagger = self.rng.randrange(players)
+        self.tagging = False
+        self.tags = 0
+        self.buffs = BuffPool()
+        spans = self.level_collision.spawn_spans
+        self.portals = {"active": True, "cooldown": 0,
+                        "positions": [get_random_portal_position(spans, rng=self.rng),
+                                      get_random_portal_position(spans, rng=self.rng)]}
+
+    @property
+    def winners(self):
+        # everyone but whoever is "it" when time runs out
+        return [p.index for p in self.players if p.index != self.tagger]
+
+    @property
+    def winner(self):
+        # two-player rounds
+        return 1 - self.tagger
+
+    def _spawn_buff(self, gravity=0.5):
+        # the rolls happen even when the pool is full so the rng stays in step
+        spans = self.level_collision.spawn_spans
+        buff = self.buffs.acquire()
+        if buff is None:
+            roll_buff(spans, gravity, self.rng, self.height)
+            return
+        self.buffs.add(spawn_buff(spans, gravity, rng=self.rng, buff=buff, height=self.height))
+
+    def _update_buffs(self):
+        # the old loop bobbed with pygame.time.get_ticks(); frame time keeps it deterministic
+        ticks = self.frame * 1000 / FPS
+        buffs = self.buffs
+        for buff in list(buffs.live.values()):
+            # bobbing
+            buff.pos[1] += math.sin(ticks * 0.005 + buff.bobbing_offset) * 0.5
+
+            if buff.timer > 0:
+                buff.timer -= 1
+                if buff.timer <= 0:
+                    if buff.applied_to is not None:
+                        self._remove_buff(buff)
+                    buffs.release(buff)
+
+    def _check_pickup(self, player):
+        buffs = self.buffs
+        if not buffs.on_ground:
+            return
+        rect = player.rect
+        for buff in list(buffs.on_ground.values()):
+            bx, by = buff.pos
+            buff_rect = pygame.Rect(int(bx - BUFF_RADIUS), int(by - BUFF_RADIUS), BUFF_RADIUS*2, BUFF_RADIUS*2)
+            if rect.colliderect(buff_rect):
+                buffs.pick_up(buff, player.index)
+                self._apply_buff(buff, player)
+
+    def _apply_buff(self, buff, player):
+        conf = buff.config
+        touched = []
+        for who, stat, op, key in conf["effects"]:
+            for target in (player,) if who == "self" else self.players:
+                if who == "enemy" and target is player:
+                    continue
+                target.modifiers.append(Modifier(stat, op, conf[key] if key else True, buff))
+                if target not in touched:
+                    touched.append(target)
+        for target in touched:
+            self._update_stats(target)
+
+    def _remove_buff(self, buff):
+        for player in self.players:
+            if any(mod.source is buff for mod in player.modifiers):
+                player.modifiers = [mod for mod in player.modifiers if mod.source is not buff]
+                self._update_stats(player)
+
+    def _update_stats(self, player):
+        # only called when the player's modifier stack changed
+        size = derive_stats(player)
+        if size != player.rect.size:
+            resize_player(self, player, *size)
+
+    def _touching_tagger(self):
+        # players overlapping the tagger, lowest index first: one pass of rect tests
+        # (collidelistall), then the mask test on the hits only
+        tagger = self.players[self.tagger]
+        others = self._others[self.tagger]
+        touching = []
+        for i in tagger.rect.collidelistall(self._other_rects[self.tagger]):
+            other = others[i]
+            offset = (other.rect.x - tagger.rect.x, other.rect.y - tagger.rect.y)
+            if tagger.mask.overlap(other.mask, offset):
+                touching.append(other)
+        return touching
+
+    def _move_player(self, player, keys):
+        stats = player.stats
+        dx = -stats["speed"] if keys & INPUT_LEFT else stats["speed"] if keys & INPUT_RIGHT else 0
+        if keys & INPUT_JUMP:
+            if self.gravity > 0 and player.on_ground:
+                player.vel_y = -abs(stats["jump"])
+                player.on_ground = False
+            elif self.gravity < 0 and player.on_ceiling:
+                player.vel_y = abs(stats["jump"])
+                player.on_ceiling = False
+
+        if not player.teleport["active"]:
+            # compute a max_jump that's at least as large as the default cap so small jumps are unchanged
+            max_jump = max(abs(stats["jump"]), player.max_fall)
+            _, player.vel_y, player.on_ground, player.on_ceiling = resolve_collision(
+                player.rect, player.mask, self.level_collision, dx, player.vel_y,
+                self.gravity, player.max_fall, max_jump=max_jump)
+        else:
+            player.on_ground = False
+
+    def step(self, inputs):
+        # inputs: one INPUT_* bitmask per player. Returns False once the round is over.
+        if self.over:
+            return False
+        rng = self.rng
+        prof = self.profiler
+
+        with prof.section("buffs"):
+            # spawn control: only spawn simple on-screen buffs if fewer than MAX_ACTIVE_BUFFS active and not applied
+            if rng.random() < 0.01 and len(self.buffs.on_ground) < MAX_ACTIVE_BUFFS:
+                self._spawn_buff(self.gravity)
+
+            # update buffs and pickups
+            self._update_buffs()
+            for player in self.players:
+                self._check_pickup(player)
+
+            # extra random spawn (keeps original behaviour: the old list never shrank,
+            # so this only ever fired for the first three buffs of a round)
+            if rng.random() < 0.005 and self.buffs.spawned < 3:
+                self._spawn_buff()
+
+        for player, keys in zip(self.players, inputs):
+            with prof.section(self._collision_sections[player.index]):
+                self._move_player(player, keys)
+
+        # clamp
+        for player in self.players:
+            player.rect.clamp_ip(self.world_rect)
+
+        # --- Tagging with shield logic ---
+        # the tagger has to let go of everyone before it can tag again
+        touching = self._touching_tagger()
+        if touching and self.tagging:
+            self.tagging = False
+            # tag only if the player being tagged has no shield
+            for tagged in touching:
+                if not tagged.stats.get("shield", False):
+                    self.players[self.tagger].tags += 1
+                    self.tagger = tagged.index
+                    self.tags += 1
+                    break
+        if not touching:
+            self.tagging = True
+        self.players[self.tagger].it_frames += 1
+
+        # update time
+        self.frame += 1
+        if self.frame >= self.round_frames:
+            self.over = True
+
+        # portals
+        with prof.section("portals"):
+            for player in self.players:
+                handle_portal_teleport(player.rect, player.teleport, self.portals)
+            portals = self.portals
+            if not portals["active"]:
+                if portals["cooldown"] > 0:
+                    portals["cooldown"] -= 1
+                else:
+                    spans = self.level_collision.spawn_spans
+                    portals["positions"] = [get_random_portal_position(spans, rng=rng),
+                                            get_random_portal_position(spans, rng=rng)]
+                    portals["active"] = True
+
+        if prof is not NULL_PROFILER:
+            for name, n in self.level_collision.take_counters().items():
+                prof.count(name, n)
+            for name, n in self.buffs.counters().items():
+                prof.count(name, n)
+
+        return not self.over
+
+
+# --- HEADLESS RUNS ---
+def random_policy(rng, players=2):
+    # mash keys: hold a direction for a while, jump now and then
+    held = [0] * players
+
+    def policy(state):
+        for i in range(len(held)):
+            if rng.random() < 0.05:
+                held[i] = rng.choice((0, INPUT_LEFT, INPUT_RIGHT))
+        return [h | (INPUT_JUMP if rng.random() < 0.1 else 0) for h in held]
+    return policy
+
+
+def simulate_round(level=0, seed=None, policy=None, round_time=ROUND_TIME, config=None, players=2):
+    state = GameState(level, seed=seed, round_time=round_time, config=config, players=players)
+    if policy is None:
+        policy = random_policy(random.Random(seed), players)
+    while state.step(policy(state)):
+        pass
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tag rounds headlessly as fast as possible.")
+    parser.add_argument("--level", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--round-time", type=int, default=ROUND_TIME)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--profile", metavar="PATH", help="write per-frame phase timings to a .csv or .json")
+    args = parser.parse_args()
+
+    wins = [0] * args.players
+    tags = 0
+    profiler = FrameProfiler(history=True) if args.profile else None
+    start = time.perf_counter()
+    for r in range(args.rounds):
+        state = GameState(args.level, seed=args.seed + r, round_time=args.round_time, players=args.players)
+        if profiler is not None:
+            state.profiler = profiler
+        policy = random_policy(random.Random(args.seed + r), args.players)
+        while state.step(policy(state)):
+            if profiler is not None:
+                profiler.end_frame()
+        for i in state.winners:
+            wins[i] += 1
+        tags += state.tags
+    elapsed = time.perf_counter() - start
+    frames = args.rounds * args.round_time * FPS
+    print(f"level {args.level}: {args.rounds} rounds in {elapsed:.2f}s "
+          f"({args.rounds / elapsed:.1f} rounds/s, {frames / elapsed:.0f} frames/s)")
+    print(f"wins {'/'.join(f'p{i + 1}' for i in range(args.players))}: {'/'.join(map(str, wins))}, "
+          f"tags per round: {tags / args.rounds:.2f}")
+    if profiler is not None:
+        profiler.export(args.profile)
+
+
+if __name__ == "__main__":
+    main()
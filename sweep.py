@@ -0,0 +1,145 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from batch import BatchSim, play_random
+from sim import FPS, ROUND_TIME, level_configs, buff_defs
+
+# Balancing sweeps: every combination of the given level physics and buff values is
+# played out by the batch simulator on its own worker process, and each finished
+# config is appended to a CSV as one row (one column per parameter and metric).
+# Re-running the same command skips configs whose id is already in the file; the id
+# covers the run settings (rounds, seed, round time) too, so changing one of them
+# runs every config again instead of resuming.
+#
+#   python sweep.py --level 2 --gravity 0.4:0.8:5 --playerJump 12,15,18 \
+#       --buff speed.duration=180,300 --buff freeze.slow_factor=0.1:0.5:3 --out plains.csv
+
+LEVEL_PARAMS = ["gravity", "playerJump", "playerSpeed", "playerMaxFall"]
+BUFF_PARAMS = ["duration", "multiplier", "slow_factor"]
+METRICS = ["rounds", "tags_mean", "tags_std", "no_tag_rate", "p1_win_rate",
+           "round_s", "first_tag_s", "elapsed_s"]
+
+
+def parse_values(text):
+    # "a,b,c" is a list of values, "start:stop:count" is evenly spaced and inclusive
+    if ":" in text:
+        start, stop, count = text.split(":")
+        return [round(v, 6) for v in np.linspace(float(start), float(stop), int(count))]
+    return [float(v) if "." in v else int(v) for v in text.split(",")]
+
+
+def config_id(level, params, rounds, round_time, seed):
+    run = {"level": level, "rounds": rounds, "round_time": round_time, "seed": seed}
+    key = json.dumps({**run, **params}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def build_grid(parser, args):
+    axes = {}
+    for name in LEVEL_PARAMS:
+        text = getattr(args, name)
+        if text is not None:
+            axes[name] = parse_values(text)
+    for item in args.buff:
+        name, _, text = item.partition("=")
+        buff, _, key = name.partition(".")
+        if buff not in buff_defs or key not in BUFF_PARAMS:
+            parser.error(f"unknown buff parameter {name!r} (use <buff>.<{'|'.join(BUFF_PARAMS)}>)")
+        if key not in buff_defs[buff]:
+            # e.g. shield.multiplier: the buff would ignore the value
+            keys = [k for k in BUFF_PARAMS if k in buff_defs[buff]]
+            parser.error(f"{buff} has no {key!r} (it has {', '.join(keys)})")
+        axes[name] = parse_values(text)
+    names = list(axes)
+    return names, [dict(zip(names, combo)) for combo in itertools.product(*(axes[n] for n in names))]
+
+
+def run_config(level, params, rounds, round_time, seed):
+    config = dict(level_configs[level])
+    buffs = {}
+    for name, value in params.items():
+        if "." in name:
+            buff, key = name.split(".")
+            buffs.setdefault(buff, {})[key] = int(value) if key == "duration" else value
+        else:
+            config[name] = value
+
+    start = time.perf_counter()
+    sim = BatchSim(rounds, config=config, seed=seed, round_time=round_time, buffs=buffs)
+    play_random(sim, seed)
+    tagged = sim.first_tag >= 0
+    return {
+        "rounds": rounds,
+        "tags_mean": round(float(sim.tags.mean()), 4),
+        "tags_std": round(float(sim.tags.std()), 4),
+        "no_tag_rate": round(float((~tagged).mean()), 4),
+        "p1_win_rate": round(float((sim.winner == 0).mean()), 4),
+        "round_s": round(float(sim.frame.mean()) / FPS, 2),
+        "first_tag_s": round(float(sim.first_tag[tagged].mean()) / FPS, 2) if tagged.any() else "",
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep level physics and buff values with the batch simulator.")
+    parser.add_argument("--level", type=int, default=0)
+    for name in LEVEL_PARAMS:
+        parser.add_argument(f"--{name}", help="a,b,c or start:stop:count")
+    parser.add_argument("--buff", action="append", default=[], metavar="BUFF.KEY=VALUES",
+                        help="e.g. speed.multiplier=1.5:3:4 (repeatable)")
+    parser.add_argument("--rounds", type=int, default=256, help="matches simulated per config")
+    parser.add_argument("--round-time", type=int, default=ROUND_TIME)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="sweep.csv")
+    args = parser.parse_args()
+
+    names, grid = build_grid(parser, args)
+    columns = ["config_id", "level", "seed", "round_time"] + names + METRICS
+
+    done = set()
+    if os.path.exists(args.out):
+        with open(args.out, newline="") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames != columns:
+                raise SystemExit(f"{args.out} was written by a different sweep; pick another --out")
+            done = {row["config_id"] for row in reader}
+
+    todo = [(config_id(args.level, p, args.rounds, args.round_time, args.seed), p) for p in grid]
+    todo = [(cid, p) for cid, p in todo if cid not in done]
+    print(f"{len(grid)} configs, {len(grid) - len(todo)} already in {args.out}, "
+          f"running {len(todo)} on {args.workers} workers")
+
+    new_file = not os.path.exists(args.out)
+    start = time.perf_counter()
+    with open(args.out, "a", newline="") as f, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        if new_file:
+            writer.writeheader()
+            f.flush()
+        futures = {pool.submit(run_config, args.level, p, args.rounds, args.round_time, args.seed): (cid, p)
+                   for cid, p in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            cid, params = futures[future]
+            row = {"config_id": cid, "level": args.level, "seed": args.seed, "round_time": args.round_time,
+                   **params, **future.result()}
+            writer.writerow(row)
+            f.flush()  # every finished config survives an interrupt
+            print(f"[{i}/{len(todo)}] {cid} tags/round {row['tags_mean']} p1 wins {row['p1_win_rate']}")
+
+    elapsed = time.perf_counter() - start
+    if todo:
+        frames = len(todo) * args.rounds * args.round_time * FPS
+        print(f"done in {elapsed:.1f}s ({frames / elapsed:.0f} match-frames/s)")
+
+
+if __name__ == "__main__":
+    main()
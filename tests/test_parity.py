@@ -0,0 +1,212 @@
+import random
+
+import numpy as np
+import pygame
+import pytest
+
+import sim
+from batch import BUFF_TYPES, BatchSim
+from collision import SLOPE_COURSE, SWEPT_TOLERANCE, LevelCollision, compare_swept
+from replay import Recording, Replay, record_round, state_digest
+
+# The fast paths checked against the code they replaced or sit next to: BatchSim
+# against GameState, swept collision against masks, the buff pool against fresh
+# allocation and replays against a straight run.
+
+LEVELS = range(len(sim.level_configs))
+
+
+def random_inputs(rng, players=2):
+    held = [0] * players
+
+    def inputs():
+        for i in range(players):
+            if rng.random() < 0.05:
+                held[i] = rng.choice((0, sim.INPUT_LEFT, sim.INPUT_RIGHT))
+        return [h | (sim.INPUT_JUMP if rng.random() < 0.1 else 0) for h in held]
+    return inputs
+
+
+class NoRolls:
+    # a numpy Generator whose random() rolls never spawn a buff
+    def __init__(self, rng):
+        self.rng = rng
+
+    def random(self, n):
+        return np.ones(n)
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+
+def paired(level, seed):
+    # a GameState and a one-match BatchSim starting from the same state, with no
+    # random buff spawns (the two draw from different generators)
+    state = sim.GameState(level, seed=seed)
+    state.rng.random = lambda: 1.0
+    batch = BatchSim(1, level=level, seed=seed)
+    batch.rng = NoRolls(batch.rng)
+    batch.tagger[:] = state.tagger
+    batch.portal_pos[0] = state.portals["positions"]
+    return state, batch
+
+
+def assert_same(state, batch, frame):
+    got = [(int(batch.x[0, i]), int(batch.y[0, i]), int(batch.w[0, i]), int(batch.h[0, i]), float(batch.speed[0, i]),
+            float(batch.jump[0, i]), bool(batch.shield[0, i]), bool(batch.frozen[0, i])) for i in range(2)]
+    want = [(*p.rect, p.stats["speed"], p.stats["jump"], p.stats.get("shield", False), p.stats.get("frozen", False))
+            for p in state.players]
+    assert got == want, f"frame {frame}"
+    assert int(batch.tagger[0]) == state.tagger, f"frame {frame}"
+
+
+# --- BATCH VS GAMESTATE ---
+@pytest.mark.parametrize("level", LEVELS)
+def test_batch_matches_gamestate(level):
+    for seed in range(3):
+        state, batch = paired(level, seed)
+        inputs = random_inputs(random.Random(seed))
+        for frame in range(600):
+            keys = inputs()
+            state.step(keys)
+            batch.step(np.array([keys]))
+            assert_same(state, batch, frame)
+
+
+def drop_buff(state, batch, name, player):
+    # put a buff of type name on player's center in both, so the next step picks it up
+    x, y = state.players[player].rect.center
+    buff = state.buffs.acquire()
+    buff.pos[:] = [x, y]
+    buff.type_name = name
+    buff.active = True
+    buff.bobbing_offset = 0.3
+    buff.config = sim.buff_defs[name]
+    state.buffs.add(buff)
+    slot = int(np.argmin(batch.buff_alive[0]))
+    batch.buff_alive[0, slot] = True
+    batch.buff_x[0, slot] = x
+    batch.buff_y[0, slot] = y
+    batch.buff_type[0, slot] = BUFF_TYPES.index(name)
+    batch.buff_bob[0, slot] = 0.3
+
+
+# repeated pickups of one type stack, and hold past each other's expiry
+PICKUPS = {30: ("speed", 0), 90: ("speed", 0), 120: ("speed", 0), 150: ("jump", 1), 200: ("jump", 1),
+           250: ("size", 0), 280: ("size", 0), 320: ("freeze", 1), 340: ("freeze", 1), 400: ("shield", 0),
+           420: ("freeze", 0)}
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_batch_matches_gamestate_with_pickups(level):
+    for seed in range(3):
+        state, batch = paired(level, seed)
+        inputs = random_inputs(random.Random(seed))
+        for frame in range(900):
+            if frame in PICKUPS:
+                drop_buff(state, batch, *PICKUPS[frame])
+            keys = inputs()
+            state.step(keys)
+            batch.step(np.array([keys]))
+            assert_same(state, batch, frame)
+        assert state.buffs.picked_up == len(PICKUPS)
+
+
+# --- SWEPT VS MASK ---
+@pytest.mark.parametrize("level", LEVELS)
+def test_swept_rounds_match_mask_rounds(level, monkeypatch):
+    for seed in range(3):
+        digests = []
+        for swept in (True, False):
+            monkeypatch.setattr(sim, "SWEPT_COLLISION", swept)
+            digests.append(state_digest(sim.simulate_round(level, seed=seed, round_time=20, players=3)))
+        assert digests[0] == digests[1], f"seed {seed}"
+
+
+def test_swept_slopes_within_tolerance():
+    result = compare_swept(SLOPE_COURSE, sim.WIDTH, sim.HEIGHT, (40, 40), moves=5000)
+    assert result["further"] == 0
+    assert result["off"] <= SWEPT_TOLERANCE * result["moves"]
+
+
+def push_out_by_pixel(level, rect, rect_mask, dx, dy, limit, start=0):
+    # the per-pixel loop push_out replaced
+    for d in range(start, limit + 1):
+        if not level.overlaps(rect, rect_mask, rect.x + dx * d, rect.y + dy * d):
+            return d
+    return None
+
+
+@pytest.mark.parametrize("swept", (True, False))
+def test_push_out_matches_pixel_steps(swept):
+    rng = random.Random(3)
+    level = LevelCollision(SLOPE_COURSE + [verts for c in sim.level_configs for verts in c["objects"]],
+                           sim.WIDTH, sim.HEIGHT, swept=swept)
+    checked = 0
+    while checked < 500:
+        size = rng.choice((10, 25, 40))
+        rect = pygame.Rect(rng.randint(0, sim.WIDTH - size), rng.randint(0, sim.HEIGHT - size), size, size)
+        rect_mask = pygame.Mask(rect.size, fill=True)
+        if not level.overlaps(rect, rect_mask):
+            continue
+        checked += 1
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            limit = size * 2
+            assert (level.push_out(rect, rect_mask, dx, dy, limit)
+                    == push_out_by_pixel(level, rect, rect_mask, dx, dy, limit)), (tuple(rect), dx, dy)
+
+
+# --- BUFF POOL VS ALLOCATION ---
+class FreshBuffs(sim.BuffPool):
+    # a new BuffInstance for every spawn and nothing reused, like the list it replaced
+    def acquire(self):
+        buff = sim.BuffInstance([0, 0], "", False, 0, 0.0, None, slot=len(self.slots))
+        self.slots.append(buff)
+        return buff
+
+    def release(self, buff):
+        super().release(buff)
+        self.free.pop()
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_buff_pool_matches_fresh_allocation(level):
+    reused = 0
+    for seed in range(3):
+        pooled = sim.GameState(level, seed=seed, players=3)
+        fresh = sim.GameState(level, seed=seed, players=3)
+        fresh.buffs = FreshBuffs(capacity=0)
+        inputs = random_inputs(random.Random(seed), 3)
+        for frame in range(sim.FPS * 30):
+            keys = inputs()
+            pooled.step(keys)
+            fresh.step(keys)
+            assert state_digest(pooled) == state_digest(fresh), f"seed {seed} frame {frame}"
+        reused += pooled.buffs.expired
+    assert reused, "no buff went back to the pool"
+
+
+# --- REPLAYS ---
+def test_replay_round_trip(tmp_path):
+    path = tmp_path / "round.tagr"
+    rec = record_round(str(path), level=2, seed=7, round_time=20, players=3)
+    loaded = Recording.load(str(path))
+    assert (loaded.seed, loaded.players, loaded.frames, loaded.digest) == (rec.seed, 3, rec.frames, rec.digest)
+    replay = Replay(loaded)
+    assert replay.verify()
+
+    # seeking back through snapshots lands on the same state as a straight run
+    straight = loaded.new_state()
+    for frame in range(700):
+        straight.step(loaded.frame_inputs(frame))
+    assert state_digest(replay.seek(700)) == state_digest(straight)
+
+
+def test_replay_rejects_other_level(tmp_path):
+    path = tmp_path / "round.tagr"
+    record_round(str(path), level=1, seed=1, round_time=1)
+    data = bytearray(path.read_bytes())
+    data[6] = 0  # the level index
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="recorded on level"):
+        Recording.load(str(path))